@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: form_group scaling
+
+Purpose: Shows form_group scales linearly with the agent population now that
+liveness checks use the unique_id key instead of scanning self._agents
+
+Each run creates a model with n agents, kills 10% of them and then runs a
+user process which yields every agent in groups of four through form_group.
+The time per agent should stay flat as n grows.
+
+Usage (from the repository root with multilevel_mesa installed):
+    python benchmarks/form_group_scaling.py --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import json
+import time
+
+from models import BenchModel, in_fours
+
+
+def run(n, seed = 0):
+
+    model = BenchModel(n, seed = seed)
+    #kill 10% of agents so the liveness checks have something to filter
+    for agent in model.population[::10]:
+        model.ml.remove(agent)
+
+    start = time.perf_counter()
+    model.ml.form_group(in_fours, model.population)
+    elapsed = time.perf_counter() - start
+
+    return {"agents": n, "groups": len(model.ml.groups),
+            "seconds": elapsed, "us_per_agent": elapsed / n * 1e6}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type = int, nargs = "+",
+                        default = [1000, 10000, 100000, 1000000])
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    results = [run(n, args.seed) for n in args.sizes]
+    print(json.dumps(results, indent = 2))
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: multilevel_mesa hot paths
+
+Purpose: Times and measures the peak memory of the main MultiLevel_Mesa
+operations so releases can be compared for regressions
+
+Each operation runs on a freshly built synthetic model, the build is not
+measured. Agents are linked in cliques of four by a 'trade' link. Two
+configurations are measured:
+    flat - group_to_net = False, one level of groups
+    recursive - group_to_net = True, groups of four agents are then linked
+    in pairs and grouped again, so there are two levels of groups
+
+Operations:
+    form_group - groups every four agents through a user process
+    group_iterate - groups every four agents from a list of links
+    net_group - groups the agents from the 'trade' links
+    step - one step of the schedule with all groups formed
+    remove - removes 10% of the agents with all groups formed
+    reassess_group - peels two agents off every group of agents with all
+    groups formed
+
+Time is the best of --repeat runs measured with time.perf_counter. Peak
+memory is measured with tracemalloc in a separate run, as tracing slows
+everything down, and is the peak allocated during the operation above what
+was allocated before it. Results are printed as JSON.
+
+Usage (from the repository root with multilevel_mesa installed):
+    python benchmarks/hot_paths.py --sizes 1000 10000 100000 1000000
+    python benchmarks/hot_paths.py --ops step remove --configs flat
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import mesa
+
+from models import BenchModel, in_fours
+
+
+OPERATIONS = ["form_group", "group_iterate", "net_group", "step", "remove",
+              "reassess_group"]
+CONFIGS = {"flat": False, "recursive": True}
+
+
+def peel_first(group_agent):
+    '''
+    User process for reassess_group, peels the first two sub agents off
+    groups of agents, groups of groups are left alone
+    '''
+
+    subs = list(group_agent.sub_agents.values())
+    if len(subs) < 2 or subs[0].type == 'group':
+        return None
+    return subs[0], subs[1]
+
+
+#Each operation is (setup, run), setup builds what run needs and is not
+#measured
+def _form_group_setup(model):
+    return None
+
+def _form_group_run(model, state):
+    model.ml.form_group(in_fours, model.population)
+
+def _group_iterate_setup(model):
+    edges = []
+    for group in in_fours(model.population):
+        edges.extend((group[0], other) for other in group[1:])
+    return edges
+
+def _group_iterate_run(model, edges):
+    model.ml.group_iterate(edges, 'default', False, None,
+                           model.ml.group_net, None)
+
+def _net_group_setup(model):
+    model.link()
+
+def _net_group_run(model, state):
+    model.ml.net_group(link_type = 'trade', link_value = 1)
+
+def _step_setup(model):
+    model.hierarchy()
+
+def _step_run(model, state):
+    model.ml.step()
+
+def _remove_setup(model):
+    model.hierarchy()
+    return model.population[::10]
+
+def _remove_run(model, dead):
+    for agent in dead:
+        model.ml.remove(agent)
+
+def _reassess_group_setup(model):
+    model.hierarchy()
+
+def _reassess_group_run(model, state):
+    model.ml.reassess_group(peel_first)
+
+
+OPS = {name: (globals()["_%s_setup" % name], globals()["_%s_run" % name])
+       for name in OPERATIONS}
+
+
+def measure(op, n, group_to_net, seed, memory):
+    '''
+    Returns seconds (or peak bytes if memory) of one run of op
+    '''
+
+    setup, run = OPS[op]
+    model = BenchModel(n, group_to_net, seed)
+    state = setup(model)
+    if memory:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        run(model, state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - base
+    start = time.perf_counter()
+    run(model, state)
+    return time.perf_counter() - start
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output = True, text = True,
+                              check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(sizes, ops, configs, repeat, seed, memory):
+
+    results = []
+    for config in configs:
+        for op in ops:
+            for n in sizes:
+                seconds = min(measure(op, n, CONFIGS[config], seed, False)
+                              for _ in range(repeat))
+                result = {"config": config, "operation": op, "agents": n,
+                          "seconds": seconds,
+                          "us_per_agent": seconds / n * 1e6}
+                if memory:
+                    result["peak_bytes"] = measure(op, n, CONFIGS[config],
+                                                   seed, True)
+                results.append(result)
+
+    return {"revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mesa": getattr(mesa, "__version__", None),
+            "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type = int, nargs = "+",
+                        default = [1000, 10000, 100000, 1000000])
+    parser.add_argument("--ops", nargs = "+", choices = OPERATIONS,
+                        default = OPERATIONS)
+    parser.add_argument("--configs", nargs = "+", choices = list(CONFIGS),
+                        default = list(CONFIGS))
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--no-memory", dest = "memory",
+                        action = "store_false",
+                        help = "skip the tracemalloc runs")
+    args = parser.parse_args()
+
+    print(json.dumps(main(args.sizes, args.ops, args.configs, args.repeat,
+                          args.seed, args.memory), indent = 2))
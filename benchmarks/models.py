@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Models shared by the multilevel_mesa benchmarks
+"""
+
+from mesa import Agent, Model
+
+import multilevel_mesa as mlm
+
+
+class BenchAgent(Agent):
+
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+        self.type = 'agent'
+
+    def step(self):
+        pass
+
+
+class BenchPolicy:
+    '''
+    Group policy which steps each sub agent, nested groups are stepped
+    through their own group_step
+    '''
+
+    def step(self, agent):
+        agent.step()
+
+
+class BenchModel(Model):
+
+    def __init__(self, n, group_to_net = False, seed = 0):
+        super().__init__(seed = seed)
+        self.ml = mlm.MultiLevel_Mesa(self, group_to_net = group_to_net)
+        self.population = [BenchAgent(i, self) for i in range(n)]
+        for agent in self.population:
+            self.ml.add(agent)
+
+    def link(self):
+        '''
+        Links every four agents as a clique with a 'trade' link
+        '''
+
+        for group in in_fours(self.population):
+            for i, a in enumerate(group):
+                for b in group[i+1:]:
+                    self.ml.net.add_edge(a, b, trade = 1)
+
+    def hierarchy(self):
+        '''
+        Forms the groups of the configuration
+        '''
+
+        self.link()
+        self.ml.net_group(link_type = 'trade', link_value = 1,
+                          policy = BenchPolicy)
+        if self.ml.group_net:
+            groups = list(self.ml.groups.values())
+            for i in range(0, len(groups) - 1, 2):
+                self.ml.net.add_edge(groups[i], groups[i+1], trade = 1)
+            self.ml.net_group(link_type = 'trade', link_value = 1,
+                              policy = BenchPolicy)
+
+
+def in_fours(agents):
+    '''
+    User process for form_group, yields groups of four agents
+    '''
+
+    for i in range(0, len(agents) - 3, 4):
+        yield agents[i:i+4]
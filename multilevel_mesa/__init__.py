@@ -8,8 +8,15 @@ Core Objects: Model, and Agent.
 import datetime
 
 from .multilevel_mesa import MultiLevel_Mesa
+from .graph import NetworkXGraph, CompactGraph
+from .stats import StepStats
+from .batch import MemberBatch
+from .checkpoint import save_checkpoint, load_checkpoint
+from .telemetry import GroupRecorder, read_chunks
 
-__all__ = ["MultiLevel_Mesa"]
+__all__ = ["MultiLevel_Mesa", "NetworkXGraph", "CompactGraph", "StepStats",
+           "MemberBatch", "save_checkpoint", "load_checkpoint",
+           "GroupRecorder", "read_chunks"]
 
 
 __title__ = 'multilevel_mesa'
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Batch Module
+
+Purpose: Provides MemberBatch, the view of the members of a group agent
+passed to batch policies
+
+Concept:
+    A group policy with a step method is called once per sub_agent by
+GroupAgent.group_step. A policy may instead have a step_group method, which
+is called once per step of the group as
+
+    policy.step_group(group, batch)
+
+where batch is a MemberBatch of the sub_agents which are not group agents
+(nested group agents are stepped with their own group_step first). Reading
+batch["sugar"] gathers the sugar attribute of every member into a NumPy
+array in the order of batch.members, and assigning batch["sugar"] = values
+(including batch["sugar"] += values) marks the column to be written back to
+the members once step_group returns. Columns changed in place, e.g.
+batch["sugar"][:] = 0, are only written back if named in the writes
+attribute of the policy. A group-wide quantity such as the mean sugar is then
+computed once per group rather than once per member.
+"""
+
+import numpy as np
+
+
+class MemberBatch:
+    '''
+    MemberBatch
+
+    Columns of member attributes of one group agent for a batch policy
+
+    Params:
+        members - list of agent objects
+        writes - names of columns written back even if never assigned
+    '''
+
+    def __init__(self, members, writes = ()):
+        self.members = members
+        self.writes = writes
+        #{attribute name: NumPy array}
+        self.columns = {}
+        self.dirty = set()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = np.array(
+                [getattr(agent, name) for agent in self.members])
+        return column
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values)
+        if values.ndim == 0 or len(values) != len(self.members):
+            raise ValueError("Column %s has %d values for %d members"
+                             % (name, values.size, len(self.members)))
+        self.columns[name] = values
+        self.dirty.add(name)
+
+    def write_back(self):
+        '''
+        Sets the assigned columns and the columns named in writes back on
+        the members as Python values
+        '''
+
+        for name in self.dirty.union(self.writes):
+            for agent, value in zip(self.members, self[name].tolist()):
+                setattr(agent, name, value)
+        self.dirty.clear()
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Checkpoint Module
+
+Purpose: Saves and restores the state of a MultiLevel_Mesa instance
+
+Concept:
+    Pickling a MultiLevel_Mesa instance walks every manager, the master
+network and the sub_net of every group agent one object at a time. A
+checkpoint instead stores the structure of the managers as flat NumPy
+arrays of integer indexes into one table of agent objects:
+    agents, multi_sched, groups - the order of each manager
+    members - the sub_agents of each group (offsets into members per group)
+    sub edges - the sub_net links of each group which keeps one
+    net nodes and net edges - the master network
+    reverse groups - (agent, group type, group) rows of reverse_groups
+Numeric link attributes are stored as columns with a mask of the links which
+have them, other attributes are pickled. The agent objects are pickled once
+with the model, the MultiLevel_Mesa instance and its network replaced by
+references, and without the managers of the group agents, which are rebuilt
+from the arrays.
+
+save_checkpoint writes the arrays with numpy.save, which writes the array
+buffers directly, and load_checkpoint maps them into memory. The managers
+are rebuilt on load, the sub_net of a group agent is only built the first
+time it is needed. snapshot and restore do the same in memory.
+
+The journals start empty after a restore, so the first reassess_net_group
+does a full pass.
+"""
+
+from contextlib import contextmanager
+import copyreg
+import gc
+import io
+import os
+import pickle
+import threading
+
+import networkx as nx
+import numpy as np
+
+from .multilevel_mesa import MultiLevel_Mesa, GroupAgent
+from .schedule import TaggedScheduleDict
+
+#Format version written into every checkpoint
+VERSION = 1
+
+#GroupAgent attributes rebuilt from the arrays or shared with MultiLevel_Mesa
+_GROUP_REBUILT = ("_agents", "reverse_groups", "group_members",
+                  "group_journal", "streams", "sub_agents",
+                  "_sub_net", "_restored_edges", "recorder", "stats", 
+                  "levels", "groups")
+
+
+#{name: object} of the objects shared by reference while a restore is
+#unpickling the agent table
+_shared = threading.local()
+
+
+def _blank_group(cls):
+    return cls.__new__(cls)
+
+
+def _shared_object(name):
+    return _shared.objects[name]
+
+
+def _pickler(file, ml, group_classes):
+    '''
+    Returns a pickler of the agent table which references the model, ml and
+    its network by name and strips the managers from group agents
+
+    The reductions go in the dispatch table, which is looked up by exact
+    type, so the other objects are pickled without calling back into Python
+    '''
+
+    pickler = pickle.Pickler(file, protocol = pickle.HIGHEST_PROTOCOL)
+    table = copyreg.dispatch_table.copy()
+    for name, obj in (("model", ml.model), ("ml", ml), ("net", ml.net)):
+        table[type(obj)] = lambda obj, name = name: (_shared_object, (name,))
+
+    def reduce_group(group):
+        state = {k: v for k, v in group.__dict__.items()
+                 if k not in _GROUP_REBUILT}
+        return _blank_group, (type(group),), state
+
+    for cls in group_classes:
+        table[cls] = reduce_group
+    pickler.dispatch_table = table
+    return pickler
+
+
+def _attr_columns(datas):
+    '''
+    Params:
+        datas - list of link attribute dictionaries
+
+    Purpose: Splits the attributes into NumPy columns with a presence mask
+    for attributes which are all bool, all int or all float and pickled lists
+    for the others
+
+    Returns: {attr: (values, present)} of both
+    '''
+
+    names = {}
+    for data in datas:
+        for name in data:
+            names[name] = None
+
+    columns = {}
+    objects = {}
+    for name in names:
+        present = np.fromiter((name in data for data in datas), dtype = bool,
+                              count = len(datas))
+        values = [data.get(name) for data in datas]
+        kinds = {type(value) for value, has in zip(values, present) if has}
+        if len(kinds) == 1 and kinds <= {bool, int, float}:
+            kind = kinds.pop()
+            column = np.array([value if has else kind() for value, has
+                               in zip(values, present)])
+            #ints beyond int64 give an object array
+            if column.dtype.kind in "biuf":
+                columns[name] = (column, present)
+                continue
+        objects[name] = (values, present.tolist())
+    return columns, objects
+
+
+def _attr_dicts(n, columns, objects):
+    '''
+    Inverse of _attr_columns
+    '''
+
+    datas = [{} for _ in range(n)]
+    for name, (column, present) in columns.items():
+        for i in np.flatnonzero(present).tolist():
+            datas[i][name] = column[i].item()
+    for name, (values, present) in objects.items():
+        for data, value, has in zip(datas, values, present):
+            if has:
+                data[name] = value
+    return datas
+
+
+@contextmanager
+def _no_gc():
+    '''
+    Pauses the garbage collector, which would otherwise run many times over
+    the millions of objects a checkpoint creates or walks
+    '''
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _edges(graph):
+    '''
+    Yields (u, v, data) of every link of graph, walking the adjacency of
+    NetworkX graphs directly rather than through an edge view
+    '''
+
+    if isinstance(graph, nx.Graph):
+        seen = set()
+        for u, nbrs in graph._adj.items():
+            for v, data in nbrs.items():
+                if v not in seen:
+                    yield u, v, data
+            seen.add(u)
+    else:
+        yield from graph.edges(data = True)
+
+
+def snapshot(ml):
+    '''
+    Params:
+        ml - MultiLevel_Mesa instance
+
+    Purpose: Captures the state of ml
+
+    Returns: (meta, objects, arrays), meta is a dictionary of the
+    attributes of ml, objects the pickled agent table and arrays a
+    dictionary of NumPy arrays
+    '''
+
+    net = ml.net
+    groups = list(ml.groups.values())
+
+    #agent table, every agent, group agent and network node once
+    table = []
+    index = {}
+    for objs in [ml._agents.values(), groups, net] + \
+                [group.sub_agents.values() for group in groups]:
+        for obj in objs:
+            if id(obj) not in index:
+                index[id(obj)] = len(table)
+                table.append(obj)
+
+    def ids(objs):
+        return np.array([index[id(obj)] for obj in objs], dtype = np.int64)
+
+    arrays = {}
+    arrays["agents"] = ids(ml._agents.values())
+    arrays["multi_sched"] = ids(ml.multi_sched.values())
+    arrays["groups"] = ids(groups)
+
+    #sub_agents and sub_nets of the groups
+    offsets = [0]
+    members = []
+    sub_offsets = [0]
+    sub_src = []
+    sub_dst = []
+    sub_datas = []
+    has_net = []
+    for group in groups:
+        members.extend([index[id(agent)] for agent in group.sub_agents.values()])
+        offsets.append(len(members))
+        if group._sub_net is None and group._restored_edges is None:
+            has_net.append(False)
+        else:
+            has_net.append(True)
+            for u, v, data in _edges(group.sub_net):
+                sub_src.append(index[id(u)])
+                sub_dst.append(index[id(v)])
+                sub_datas.append(data)
+        sub_offsets.append(len(sub_src))
+    arrays["member_offsets"] = np.array(offsets, dtype = np.int64)
+    arrays["members"] = np.array(members, dtype = np.int64)
+    arrays["has_sub_net"] = np.array(has_net, dtype = bool)
+    arrays["sub_offsets"] = np.array(sub_offsets, dtype = np.int64)
+    arrays["sub_src"] = np.array(sub_src, dtype = np.int64)
+    arrays["sub_dst"] = np.array(sub_dst, dtype = np.int64)
+    sub_columns, sub_objects = _attr_columns(sub_datas)
+
+    #master network
+    arrays["net_nodes"] = ids(net)
+    net_src = []
+    net_dst = []
+    net_datas = []
+    for u, v, data in _edges(net):
+        net_src.append(index[id(u)])
+        net_dst.append(index[id(v)])
+        net_datas.append(data)
+    arrays["net_src"] = np.array(net_src, dtype = np.int64)
+    arrays["net_dst"] = np.array(net_dst, dtype = np.int64)
+    net_columns, net_objects = _attr_columns(net_datas)
+    node_data = {}
+    if isinstance(net, nx.Graph):
+        node_data = {index[id(node)]: dict(data)
+                     for node, data in net._node.items() if data}
+
+    #reverse_groups, keys and groups by unique_id
+    uids = {}
+    uid_list = []
+
+    def uid(key):
+        i = uids.get(key)
+        if i is None:
+            i = uids[key] = len(uid_list)
+            uid_list.append(key)
+        return i
+
+    group_types = {}
+    rows = []
+    for key, by_type in ml.reverse_groups.items():
+        for group_type, gids in by_type.items():
+            t = group_types.setdefault(group_type, len(group_types))
+            for gid in gids:
+                rows.append((uid(key), t, uid(gid)))
+    reverse = np.array(rows, dtype = np.int64).reshape(len(rows), 3)
+    arrays["reverse_groups"] = reverse
+
+    for prefix, columns in (("sub", sub_columns), ("net", net_columns)):
+        for n, (name, (column, present)) in enumerate(columns.items()):
+            arrays["%s_attr%d" % (prefix, n)] = column
+            arrays["%s_attr%d_present" % (prefix, n)] = present
+
+    buffer = io.BytesIO()
+    group_classes = {type(obj) for obj in table if isinstance(obj, GroupAgent)}
+    _pickler(buffer, ml, group_classes).dump(table)
+    objects = buffer.getvalue()
+
+    meta = {"version": VERSION,
+            "cls": type(ml),
+            "graph_backend": type(ml.net),
+            "min_for_group": ml.min,
+            "group_to_net": ml.group_net,
+            "compact_groups": ml.compact_groups,
+            "shuffle_seed": None if ml.streams == None else ml.streams.seed,
+            "time": ml.time,
+            "steps": ml.steps,
+            "id_counter": ml.id_counter,
+            "random_state": ml.model.random.getstate(),
+            "uids": uid_list,
+            "group_types": list(group_types),
+            "sub_attrs": list(sub_columns),
+            "sub_objects": sub_objects,
+            "net_attrs": list(net_columns),
+            "net_objects": net_objects,
+            "node_data": node_data}
+
+    return meta, objects, arrays
+
+
+def restore(state, model, restore_random = True):
+    '''
+    Params:
+        state - (meta, objects, arrays) from snapshot
+        model - model the restored agents belong to
+        restore_random - True or False; set model.random to its state when
+        the snapshot was taken
+
+    Purpose: Rebuilds a MultiLevel_Mesa instance from a snapshot
+
+    Returns: the MultiLevel_Mesa instance, which is not assigned to model
+    '''
+
+    meta, objects, arrays = state
+    if meta["version"] != VERSION:
+        raise ValueError("Checkpoint version %s is not supported"
+                         % meta["version"])
+
+    cls = meta["cls"]
+    ml = cls.__new__(cls)
+    MultiLevel_Mesa.__init__(ml, model, min_for_group = meta["min_for_group"],
+                             group_to_net = meta["group_to_net"],
+                             compact_groups = meta["compact_groups"],
+                             graph_backend = meta["graph_backend"],
+                             shuffle_seed = meta["shuffle_seed"])
+    ml.time = meta["time"]
+    ml.steps = meta["steps"]
+    ml.id_counter = meta["id_counter"]
+    if restore_random:
+        model.random.setstate(meta["random_state"])
+
+    _shared.objects = {"model": model, "ml": ml, "net": ml.net}
+    try:
+        table = pickle.loads(objects)
+    finally:
+        del _shared.objects
+
+    for agent in (table[i] for i in arrays["agents"].tolist()):
+        ml._agents[agent.unique_id] = agent
+        ml.agents_by_type[type(agent)][agent.unique_id] = agent
+    for agent in (table[i] for i in arrays["multi_sched"].tolist()):
+        ml.multi_sched[agent.unique_id] = agent
+
+    #reverse_groups and group_members
+    uids = meta["uids"]
+    group_types = meta["group_types"]
+    for key, t, gid in arrays["reverse_groups"].tolist():
+        ml._join_group(uids[key], group_types[t], uids[gid])
+
+    #group agents, sub_nets are built when first needed
+    offsets = arrays["member_offsets"].tolist()
+    members = arrays["members"].tolist()
+    has_net = arrays["has_sub_net"].tolist()
+    sub_offsets = arrays["sub_offsets"].tolist()
+    sub_src = arrays["sub_src"].tolist()
+    sub_dst = arrays["sub_dst"].tolist()
+    sub_datas = _attr_dicts(len(sub_src),
+                            _columns(arrays, "sub", meta["sub_attrs"]),
+                            meta["sub_objects"])
+    for n, i in enumerate(arrays["groups"].tolist()):
+        group = table[i]
+        ml.groups[group.unique_id] = group
+        group._agents = ml._agents
+        group.reverse_groups = ml.reverse_groups
+        group.group_members = ml.group_members
+        group.group_journal = ml.group_journal
+        group.streams = ml.streams
+        group.levels = ml.levels
+        group.groups = ml.groups
+        ml.group_type_counts[group.group_type] += 1
+        ml.levels[group.level][group.unique_id] = group
+        group.sub_agents = TaggedScheduleDict((table[m].unique_id, table[m])
+                                              for m in 
+                                              members[offsets[n]:offsets[n+1]])
+        group._sub_net = None
+        #checkpoints written before compact groups kept absent links
+        group.__dict__.setdefault("_absent", {})
+        if has_net[n]:
+            start, end = sub_offsets[n], sub_offsets[n+1]
+            group._restored_edges = [(table[sub_src[e]], table[sub_dst[e]],
+                                      sub_datas[e])
+                                     for e in range(start, end)]
+        else:
+            group._restored_edges = None
+
+    #master network
+    net = ml.net
+    node_data = meta["node_data"]
+    for i in arrays["net_nodes"].tolist():
+        net.add_node(table[i], **node_data.get(i, {}))
+    net_src = arrays["net_src"].tolist()
+    net_dst = arrays["net_dst"].tolist()
+    net_datas = _attr_dicts(len(net_src),
+                            _columns(arrays, "net", meta["net_attrs"]),
+                            meta["net_objects"])
+    net.add_edges_from((table[u], table[v], data) for u, v, data
+                       in zip(net_src, net_dst, net_datas))
+
+    return ml
+
+
+def _columns(arrays, prefix, names):
+    return {name: (arrays["%s_attr%d" % (prefix, n)],
+                   arrays["%s_attr%d_present" % (prefix, n)])
+            for n, name in enumerate(names)}
+
+
+def save_checkpoint(ml, path):
+    '''
+    Params:
+        ml - MultiLevel_Mesa instance
+        path - directory to write the checkpoint to, created if needed
+
+    Purpose: Writes a snapshot of ml as one .npy file per array plus
+    meta.pkl and objects.pkl
+    '''
+
+    with _no_gc():
+        meta, objects, arrays = snapshot(ml)
+    os.makedirs(path, exist_ok = True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array,
+                allow_pickle = False)
+    with open(os.path.join(path, "objects.pkl"), "wb") as f:
+        f.write(objects)
+    #meta is written last, a checkpoint without it is incomplete
+    meta["arrays"] = list(arrays)
+    with open(os.path.join(path, "meta.pkl"), "wb") as f:
+        pickle.dump(meta, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path, model, restore_random = True):
+    '''
+    Params:
+        path - directory written by save_checkpoint
+        model - model the restored agents belong to
+        restore_random - as in restore
+
+    Purpose: Restores a MultiLevel_Mesa instance from a checkpoint, the
+    arrays are memory mapped rather than read
+
+    Returns: the MultiLevel_Mesa instance, which is not assigned to model
+    '''
+
+    with open(os.path.join(path, "meta.pkl"), "rb") as f:
+        meta = pickle.load(f)
+    arrays = {name: np.load(os.path.join(path, name + ".npy"),
+                            mmap_mode = "r", allow_pickle = False)
+              for name in meta["arrays"]}
+    with open(os.path.join(path, "objects.pkl"), "rb") as f:
+        objects = f.read()
+    with _no_gc():
+        return restore((meta, objects, arrays), model, restore_random)
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Graph Module
+
+Purpose: Provides the graph backends for the master network of ML Mesa
+(MultiLevel_Mesa.net)
+
+Concept:
+    MultiLevel_Mesa only talks to its master network through a small
+interface, so the network can be swapped for a different data structure.
+A backend is a class which can be created without parameters and provides:
+
+    -- add_node, add_nodes_from, remove_node, has_node and `in`
+    -- add_edge(u, v, **attr), add_edges_from, remove_edge,
+       remove_edges_from, has_edge
+    -- edge_data(attr) - yields (u, v, value of attr or None) for every edge
+    -- edge_list() - list of (u, v) for every edge
+    -- select_edges(predicates) - list of (u, v) for the edges which meet
+       every (attr, op, value) predicate, see OPERATORS
+    -- journal - ChangeJournal in which every removed edge (u, v) is recorded,
+       however it was removed (optional, without it reassess_net_group
+       always does a full pass)
+
+Nodes are always agent objects. Two backends are provided:
+
+    -- NetworkXGraph (default) a NetworkX Graph with the interface added, so
+       all NetworkX functions still work on MultiLevel_Mesa.net
+    -- CompactGraph which maps agent unique_ids to dense ints, stores the
+       adjacency as an array of dictionaries {neighbor: edge id} and keeps
+       edge attributes in columnar NumPy arrays
+"""
+
+import itertools
+import operator
+
+import networkx as nx
+import numpy as np
+
+from .journal import ChangeJournal, ALL_CHANGED
+
+
+#Comparison operators supported by select_edges predicates
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda values, value: np.isin(values, list(value)),
+}
+
+
+def _edge_mask(n_edges, column, predicates):
+    '''
+    Params:
+        n_edges - number of edges
+        column - function which takes an attribute and returns the
+        (values, present) arrays of that attribute for every edge
+        predicates - list of (attr, op, value)
+
+    Purpose: Boolean mask of the edges which meet every predicate, edges
+    without the attribute never match
+    '''
+
+    mask = np.ones(n_edges, dtype = bool)
+    for attr, op, value in predicates:
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator %s, use one of %s"
+                             % (op, list(OPERATORS)))
+        values, present = column(attr)
+        hit = np.zeros(n_edges, dtype = bool)
+        if present.any():
+            hit[present] = np.asarray(OPERATORS[op](values[present], value),
+                                      dtype = bool)
+        mask &= hit
+    return mask
+
+
+def _to_column(values, present):
+    '''
+    Converts list of attribute values (None if missing) to a NumPy array,
+    numeric or string values get a typed array and anything else an object
+    array
+    '''
+
+    filled = [value for value in values if value is not None]
+    typed = np.array(filled) if filled else np.zeros(0)
+    if typed.ndim == 1 and (typed.dtype.kind in "biuf" or (typed.dtype.kind
+                            == "U" and all(type(v) == str for v in filled))):
+        column = np.zeros(len(values), dtype = typed.dtype)
+        column[present] = typed
+    else:
+        column = np.empty(len(values), dtype = object)
+        for i, value in enumerate(values):
+            column[i] = value
+    return column
+
+
+class NetworkXGraph(nx.Graph):
+    '''
+    NetworkXGraph
+
+    Default backend of the master network, a NetworkX Graph keyed by agent
+    objects
+
+    The NetworkX functions which remove edges or nodes are extended to record
+    the removed edges in the journal
+    '''
+
+    def __init__(self, incoming_graph_data = None, **attr):
+        self.journal = ChangeJournal()
+        super().__init__(incoming_graph_data, **attr)
+
+    def remove_edge(self, u, v):
+        super().remove_edge(u, v)
+        self.journal.record((u, v))
+
+    def remove_edges_from(self, ebunch):
+        if self.journal.cursors:
+            ebunch = list(ebunch)
+            for edge in ebunch:
+                self.journal.record((edge[0], edge[1]))
+        super().remove_edges_from(ebunch)
+
+    def remove_node(self, n):
+        if self.journal.cursors and n in self._adj:
+            for neighbor in self._adj[n]:
+                self.journal.record((n, neighbor))
+        super().remove_node(n)
+
+    def remove_nodes_from(self, nodes):
+        if self.journal.cursors:
+            nodes = list(nodes)
+            for n in nodes:
+                if n in self._adj:
+                    for neighbor in self._adj[n]:
+                        self.journal.record((n, neighbor))
+        super().remove_nodes_from(nodes)
+
+    def clear(self):
+        self.journal.record(ALL_CHANGED)
+        super().clear()
+
+    def clear_edges(self):
+        self.journal.record(ALL_CHANGED)
+        super().clear_edges()
+
+    def edge_data(self, attr):
+        '''
+        Yields (u, v, value) for every edge, value is None if the edge does
+        not have attr
+        '''
+
+        yield from self.edges.data(attr)
+
+    def edge_list(self):
+        '''
+        List of (u, v) for every edge
+        '''
+
+        return list(self.edges())
+
+    def select_edges(self, predicates):
+        '''
+        List of (u, v) for the edges which meet every (attr, op, value)
+        predicate
+
+        Each attribute is extracted from the graph once and compared for all
+        edges at once
+        '''
+
+        #walk the adjacency once, keeping the edge data dictionaries in order
+        us, vs, datas = [], [], []
+        seen = set()
+        for u, neighbors in self._adj.items():
+            for v, data in neighbors.items():
+                if v not in seen:
+                    us.append(u)
+                    vs.append(v)
+                    datas.append(data)
+            seen.add(u)
+
+        def column(attr):
+            values = [data.get(attr) for data in datas]
+            present = np.fromiter((value is not None for value in values),
+                                  dtype = bool, count = len(values))
+            return _to_column(values, present), present
+
+        mask = _edge_mask(len(datas), column, predicates)
+        return list(itertools.compress(zip(us, vs), mask.tolist()))
+
+
+def _value_dtype(value):
+    '''
+    NumPy dtype needed to store value in an edge attribute column
+    '''
+
+    if isinstance(value, (bool, np.bool_)):
+        return np.dtype(bool)
+    if isinstance(value, (int, np.integer)):
+        return np.dtype(np.int64)
+    if isinstance(value, (float, np.floating)):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def _grow(array, capacity):
+    '''
+    Returns copy of array with length capacity, new slots are zero
+    '''
+
+    new = np.zeros(capacity, dtype = array.dtype)
+    new[:len(array)] = array
+    return new
+
+
+class CompactGraph:
+    '''
+    CompactGraph
+
+    Integer indexed backend of the master network
+
+    Managers:
+        -- _index {unique_id: int} dense int of each node
+        -- _nodes [agent object] node of each int, None if free
+        -- _adj [{neighbor int: edge id}] adjacency of each int
+        -- _src, _dst, _alive arrays of edge end points and status by edge id
+        -- _columns {attr: array} edge attribute values by edge id
+        -- _present {attr: bool array} whether the edge has the attribute
+    '''
+
+    def __init__(self):
+        self._index = {}
+        self._nodes = []
+        self._adj = []
+        self._free_nodes = []
+        #edge storage, edge ids are reused once the edge is removed
+        self._capacity = 16
+        self._n_slots = 0
+        self._n_edges = 0
+        self._free_edges = []
+        self._src = np.zeros(self._capacity, dtype = np.int64)
+        self._dst = np.zeros(self._capacity, dtype = np.int64)
+        self._alive = np.zeros(self._capacity, dtype = bool)
+        self._columns = {}
+        self._present = {}
+        self.journal = ChangeJournal()
+
+    #########################################################
+    #
+    #    Helper Functions
+    #
+    #########################################################
+
+    @staticmethod
+    def _key(node):
+        return getattr(node, "unique_id", node)
+
+    def _node_id(self, node):
+        '''
+        Dense int of node, raises NetworkXError if it is not in the graph
+        '''
+
+        try:
+            return self._index[self._key(node)]
+        except KeyError:
+            raise nx.NetworkXError("The node %s is not in the graph." % (node,))
+
+    def _edge_id(self, u, v):
+        index = self._index
+        i = index.get(getattr(u, "unique_id", u))
+        j = index.get(getattr(v, "unique_id", v))
+        if i is None or j is None:
+            return None
+        return self._adj[i].get(j)
+
+    def _new_edge(self, i, j):
+        if self._free_edges:
+            eid = self._free_edges.pop()
+        else:
+            if self._n_slots == self._capacity:
+                self._capacity *= 2
+                self._src = _grow(self._src, self._capacity)
+                self._dst = _grow(self._dst, self._capacity)
+                self._alive = _grow(self._alive, self._capacity)
+                for attr in self._columns:
+                    self._columns[attr] = _grow(self._columns[attr], self._capacity)
+                    self._present[attr] = _grow(self._present[attr], self._capacity)
+            eid = self._n_slots
+            self._n_slots += 1
+        self._src[eid] = i
+        self._dst[eid] = j
+        self._alive[eid] = True
+        self._adj[i][j] = eid
+        self._adj[j][i] = eid
+        self._n_edges += 1
+        return eid
+
+    def _drop_edge(self, eid):
+        i = int(self._src[eid])
+        j = int(self._dst[eid])
+        self.journal.record((self._nodes[i], self._nodes[j]))
+        del self._adj[i][j]
+        if i != j:
+            del self._adj[j][i]
+        self._alive[eid] = False
+        for present in self._present.values():
+            present[eid] = False
+        self._free_edges.append(eid)
+        self._n_edges -= 1
+
+    def _set_attr(self, eid, attr, value):
+        column = self._columns.get(attr)
+        dtype = _value_dtype(value)
+        if column is None:
+            column = np.zeros(self._capacity, dtype = dtype)
+            self._present[attr] = np.zeros(self._capacity, dtype = bool)
+        elif column.dtype != dtype and column.dtype != object:
+            #promote column so it can hold value (e.g. int -> float -> object)
+            new_dtype = np.result_type(column.dtype, dtype)
+            if new_dtype != column.dtype:
+                column = column.astype(new_dtype)
+        self._columns[attr] = column
+        column[eid] = value
+        self._present[attr][eid] = True
+
+    def _get_attr(self, eid, attr):
+        present = self._present.get(attr)
+        if present is None or not present[eid]:
+            return None
+        value = self._columns[attr][eid]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def _edge_ids(self):
+        return np.flatnonzero(self._alive[:self._n_slots])
+
+    #########################################################
+    #
+    #    Nodes
+    #
+    #########################################################
+
+    def add_node(self, node, **attr):
+        #node attributes live on the agent objects, so attr is not stored
+        self._add_node(node)
+
+    def _add_node(self, node):
+        '''
+        Returns the dense int of node, adding node if it is not in the graph
+
+        Nodes are keyed by unique_id, so a different node with the unique_id
+        of a node in the graph (e.g. a group agent given the id of an agent)
+        raises ValueError rather than replacing it
+        '''
+
+        key = self._key(node)
+        i = self._index.get(key)
+        if i is not None:
+            existing = self._nodes[i]
+            if existing is not node and existing != node:
+                raise ValueError("Node %s has the unique_id %r of node %s "
+                                 "already in the graph" % (node, key,
+                                                            existing))
+            return i
+        if self._free_nodes:
+            i = self._free_nodes.pop()
+            self._nodes[i] = node
+        else:
+            i = len(self._nodes)
+            self._nodes.append(node)
+            self._adj.append({})
+        self._index[key] = i
+        return i
+
+    def add_nodes_from(self, nodes):
+        for node in nodes:
+            self.add_node(node)
+
+    def remove_node(self, node):
+        i = self._node_id(node)
+        for eid in list(self._adj[i].values()):
+            self._drop_edge(eid)
+        del self._index[self._key(node)]
+        self._nodes[i] = None
+        self._free_nodes.append(i)
+
+    def remove_nodes_from(self, nodes):
+        for node in nodes:
+            if node in self:
+                self.remove_node(node)
+
+    def has_node(self, node):
+        return self._key(node) in self._index
+
+    def __contains__(self, node):
+        try:
+            return self._key(node) in self._index
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return (node for node in self._nodes if node is not None)
+
+    def __len__(self):
+        return len(self._index)
+
+    def nodes(self):
+        return list(self)
+
+    def number_of_nodes(self):
+        return len(self._index)
+
+    def neighbors(self, node):
+        nodes = self._nodes
+        return iter([nodes[j] for j in self._adj[self._node_id(node)]])
+
+    def degree(self, node):
+        return len(self._adj[self._node_id(node)])
+
+    #########################################################
+    #
+    #    Edges
+    #
+    #########################################################
+
+    def add_edge(self, u, v, **attr):
+        i = self._add_node(u)
+        j = self._add_node(v)
+        eid = self._adj[i].get(j)
+        if eid is None:
+            eid = self._new_edge(i, j)
+        for name, value in attr.items():
+            self._set_attr(eid, name, value)
+
+    def add_edges_from(self, ebunch, **attr):
+        for edge in ebunch:
+            if len(edge) == 3:
+                data = dict(attr)
+                data.update(edge[2])
+                self.add_edge(edge[0], edge[1], **data)
+            else:
+                self.add_edge(edge[0], edge[1], **attr)
+
+    def remove_edge(self, u, v):
+        eid = self._edge_id(u, v)
+        if eid is None:
+            raise nx.NetworkXError("The edge %s-%s is not in the graph" % (u, v))
+        self._drop_edge(eid)
+
+    def remove_edges_from(self, ebunch):
+        for edge in ebunch:
+            eid = self._edge_id(edge[0], edge[1])
+            if eid is not None:
+                self._drop_edge(eid)
+
+    def has_edge(self, u, v):
+        return self._edge_id(u, v) is not None
+
+    def number_of_edges(self):
+        return self._n_edges
+
+    def get_edge_data(self, u, v, default = None):
+        eid = self._edge_id(u, v)
+        if eid is None:
+            return default
+        return dict((attr, self._get_attr(eid, attr)) for attr in self._columns
+                    if self._present[attr][eid])
+
+    def set_edge_attr(self, u, v, **attr):
+        '''
+        Sets attributes of an existing edge
+        '''
+
+        eid = self._edge_id(u, v)
+        if eid is None:
+            raise nx.NetworkXError("The edge %s-%s is not in the graph" % (u, v))
+        for name, value in attr.items():
+            self._set_attr(eid, name, value)
+
+    def edges(self, data = False):
+        '''
+        List of edges like NetworkX Graph.edges(data)
+        '''
+
+        nodes = self._nodes
+        if data == False:
+            return self.edge_list()
+        if data == True:
+            return [(nodes[self._src[e]], nodes[self._dst[e]],
+                     self.get_edge_data(nodes[self._src[e]], nodes[self._dst[e]]))
+                    for e in self._edge_ids()]
+        return list(self.edge_data(data))
+
+    def edge_data(self, attr):
+        '''
+        Yields (u, v, value) for every edge, value is None if the edge does
+        not have attr
+        '''
+
+        eids = self._edge_ids()
+        present = self._present.get(attr)
+        if present is None:
+            values = [None] * len(eids)
+        else:
+            values = [value if has else None for value, has in
+                      zip(self._columns[attr][eids].tolist(), present[eids].tolist())]
+        get = self._nodes.__getitem__
+        yield from zip(map(get, self._src[eids].tolist()),
+                       map(get, self._dst[eids].tolist()), values)
+
+    def edge_list(self):
+        '''
+        List of (u, v) for every edge
+        '''
+
+        eids = self._edge_ids()
+        get = self._nodes.__getitem__
+        return list(zip(map(get, self._src[eids].tolist()),
+                        map(get, self._dst[eids].tolist())))
+
+    def select_edges(self, predicates):
+        '''
+        List of (u, v) for the edges which meet every (attr, op, value)
+        predicate, evaluated on the attribute columns with NumPy masks
+        '''
+
+        eids = self._edge_ids()
+        n_edges = len(eids)
+
+        def column(attr):
+            if attr not in self._columns:
+                return np.zeros(n_edges), np.zeros(n_edges, dtype = bool)
+            return self._columns[attr][eids], self._present[attr][eids]
+
+        eids = eids[_edge_mask(n_edges, column, predicates)]
+        get = self._nodes.__getitem__
+        return list(zip(map(get, self._src[eids].tolist()),
+                        map(get, self._dst[eids].tolist())))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Journal Module
+
+Purpose: Provides the change journal which lets MultiLevel_Mesa functions
+only look at what changed since they last ran
+
+Concept:
+    The graph backends record removed links and MultiLevel_Mesa records group
+agents which gained members. A function such as reassess_net_group subscribes
+to the journal under a key and reads the entries recorded since its last
+read. Nothing is recorded until something subscribes and entries are
+forgotten once every subscriber has read them, so the journal costs nothing
+for models which do not use it and stays as small as the change between
+reads. A subscriber which falls more than max_lag entries behind is dropped
+and reads None, as if it never subscribed, so it falls back to a full pass
+rather than the journal holding (and keeping alive) every change since it
+last read.
+"""
+
+#Entry recorded when everything may have changed (e.g. the graph is cleared)
+ALL_CHANGED = None
+
+
+class ChangeJournal:
+    '''
+    ChangeJournal
+
+    Append only log of changes read by one or more subscribers
+
+    Params:
+        max_lag - number of unread entries after which a subscriber is 
+        dropped, None to never drop subscribers
+    '''
+
+    def __init__(self, max_lag = 10000):
+        self.max_lag = max_lag
+        self.entries = []
+        #absolute position of entries[0]
+        self.start = 0
+        #{subscriber key: absolute position read up to}
+        self.cursors = {}
+
+    def record(self, entry):
+        if self.cursors:
+            self.entries.append(entry)
+            if self.max_lag != None and len(self.entries) > self.max_lag:
+                self._drop_stale()
+
+    def subscribe(self, key):
+        '''
+        Starts recording for key, only changes after this call are read
+        '''
+
+        self.cursors[key] = self.start + len(self.entries)
+
+    def unsubscribe(self, key):
+        '''
+        Stops reading for key, does nothing if key has not subscribed
+        '''
+
+        if self.cursors.pop(key, None) != None:
+            self._forget_read()
+
+    def read(self, key):
+        '''
+        Returns list of entries recorded since key last read, None if key has
+        not subscribed
+        '''
+
+        position = self.cursors.get(key)
+        if position is None:
+            return None
+        changes = self.entries[position - self.start:]
+        self.cursors[key] = self.start + len(self.entries)
+        self._forget_read()
+        return changes
+
+    def _drop_stale(self):
+        '''
+        Drops the subscribers more than max_lag entries behind
+        '''
+
+        end = self.start + len(self.entries)
+        for key, position in list(self.cursors.items()):
+            if end - position > self.max_lag:
+                del self.cursors[key]
+        self._forget_read()
+
+    def _forget_read(self):
+        '''
+        Forgets the entries every subscriber has read
+        '''
+
+        if not self.cursors:
+            self.start += len(self.entries)
+            self.entries = []
+            return
+        first = min(self.cursors.values())
+        if first > self.start:
+            del self.entries[:first - self.start]
+            self.start = first
+
+    def __getstate__(self):
+        #subscribers are not carried over, they re-subscribe with a full pass
+        return {"max_lag": self.max_lag, "entries": [], "start": 0, 
+                "cursors": {}}
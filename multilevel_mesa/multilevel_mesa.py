@@ -35,38 +35,107 @@ The main areas for the ML_Mesa Class are:
         --remove_link
 """
 
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from operator import methodcaller
+import os
+import threading
+from time import perf_counter
 import networkx as nx
 #from mesa.time import BaseScheduler
 import itertools
 
+from .batch import MemberBatch
+from .graph import NetworkXGraph
+from .schedule import (ScheduleDict, ShuffleStreams, TaggedScheduleDict,
+                       TypeViews)
+from .stats import StepStats
+from .telemetry import GroupRecorder
+from .union_find import UnionFind
+from .journal import ChangeJournal, ALL_CHANGED
+
+#Summary returned by the remove functions, unique_ids of the agents removed
+#and of the group agents dissolved as a result
+Removed = namedtuple("Removed", ["agents", "groups"])
+
+#Plan entries which call the step and group_step of an agent
+_step = methodcaller("step")
+_group_step = methodcaller("group_step")
+
+def group_types():
+    '''
+    Default factory of reverse_groups, a module level function rather than 
+    a lambda so the managers can be pickled
+    '''
+    
+    return defaultdict(set)
+
 class MultiLevel_Mesa:#(BaseScheduler):
     
-    def __init__(self, model, min_for_group = 2, group_to_net = False):
+    #True while _run_shards steps or assesses group agents in threads, set
+    #on the instance so the calls made on it are queued (see _defer), the
+    #class attribute is the default of every instance and of GroupAgent
+    _parallel = False
+    #StepStats while profiling (see enable_stats), otherwise None
+    stats = None
+    #GroupRecorder while recording (see start_recording), otherwise None
+    recorder = None
+    
+    def __init__(self, model, min_for_group = 2, group_to_net = False,
+                 compact_groups = False, graph_backend = NetworkXGraph,
+                 shuffle_seed = None):
         #super().__init__(model)
         self.model = model
         #Maintains master dictionary of all agents in model
         self._agents = OrderedDict()
-        #Maintains master network of all agents in model
-        self.net = nx.Graph()
+        #Maintains master network of all agents in model, graph_backend is
+        #the class of the network (see graph.py)
+        self.net = graph_backend()
         #Provides view of agents by type
-        self.agents_by_type = defaultdict(dict)
+        self.agents_by_type = defaultdict(ScheduleDict)
         #Dictionary of agents who are active for each time step
-        self.multi_sched = OrderedDict()
+        self.multi_sched = ScheduleDict()
         #Minimum number of agent to eleminate a group agent
         self.min = min_for_group
         #Counter for Group Agent tracking
         self.id_counter = 0
         #Attribute for making hierarchies
         self.group_net = group_to_net
+        #Attribute for GroupAgents to build sub_net only when needed
+        self.compact_groups = compact_groups
         #Ordered dictionary of group agents
-        self.groups = OrderedDict()
+        self.groups = ScheduleDict()
         #Reverse dictionary of Agents to Groups by linktype to which they belong
-        self.reverse_groups = defaultdict(lambda: defaultdict(set))
+        self.reverse_groups = defaultdict(group_types)
+        #Forward dictionary of Groups to the Agents which reference them in 
+        #reverse_groups
+        self.group_members = defaultdict(set)
+        #Journal of group agents which gained agents, read by 
+        #reassess_net_group
+        self.group_journal = ChangeJournal()
+        #{link_type: link_value} reassess_net_group last read the journals 
+        #of link_type for
+        self.journal_values = {}
+        #Per group random streams for shuffling if seeded, otherwise 
+        #shuffles use model.random
+        if shuffle_seed == None: 
+            self.streams = None
+        else: 
+            self.streams = ShuffleStreams(shuffle_seed)
         #Mirror Mesa time set up
         self.time = 0
         #Mirror Mesa step set up
         self.steps = 0
+        #Cached agent_count, reset by add and remove
+        self._agent_count = None
+        #Number of group agents by group type, maintained by group formation
+        #and dissolution
+        self.group_type_counts = defaultdict(int)
+        #Level index of the hierarchy {level: {unique_id: group agent}}, 
+        #level 1 holds the groups of agents, level 2 the groups with level 1
+        #groups as sub_agents and so on
+        self.levels = defaultdict(ScheduleDict)
 
 
 
@@ -74,12 +143,13 @@ class MultiLevel_Mesa:#(BaseScheduler):
     def agent_count(self):
         '''
         Acts as an attribute of ML_Mesa Class
-        Provides number of agents by agent type
+        Provides number of agents by agent type as a tuple of (type, count),
+        only rebuilt after agents are added or removed
         '''
-        agents =[]
-        for k,v in self.agents_by_type.items(): 
-            agents.append((k, len(v)))
-        return agents
+        if self._agent_count == None: 
+            self._agent_count = tuple((k, len(v)) for k,v in 
+                                      self.agents_by_type.items())
+        return self._agent_count
     
     @property
     def active_agent_count(self):
@@ -87,12 +157,98 @@ class MultiLevel_Mesa:#(BaseScheduler):
         Acts as an attribute of ML_Mesa Class
         Provides number of group agents in the multi schedule
         '''
-        return len(self.multi_sched.keys())
+        return len(self.multi_sched)
 
     @property
     def agents(self):
-        return list(self.multi_sched.values())
+        '''
+        Read only view of the agents in the multi schedule, no copy is made
+        '''
+        return self.multi_sched.values()
+    
+    @property
+    def group_count(self):
+        '''
+        Acts as an attribute of ML_Mesa Class
+        Provides number of group agents by group type as a tuple of 
+        (group_type, count)
+        '''
+        return tuple((k, v) for k, v in self.group_type_counts.items() if v)
+    
+    @property
+    def level_count(self):
+        '''
+        Acts as an attribute of ML_Mesa Class
+        Provides number of group agents at each level of the hierarchy as a
+        tuple of (level, count), level 1 groups are groups of agents
+        '''
+        return tuple(sorted((k, len(v)) for k, v in self.levels.items() if v))
+    
+    def level_of(self, agent):
+        '''
+        Returns the level of agent in the hierarchy, 0 for an agent which is
+        not a group agent
+        '''
+        
+        return getattr(agent, "level", 0)
 
+    def enable_stats(self, callback = None):
+        '''
+        Params: 
+            callback - function called with the StepRecord of each step
+        
+        Purpose: Starts profiling step (see stats.py), returns the StepStats
+        which holds the totals
+        '''
+        
+        self.stats = StepStats(callback)
+        #group agents time the sub_agents they step
+        for group in self.groups.values(): 
+            group.stats = self.stats
+        return self.stats
+    
+    def disable_stats(self):
+        '''
+        Purpose: Stops profiling step, returns the StepStats of the profiled 
+        steps
+        '''
+        
+        stats = self.stats
+        self.stats = None
+        for group in self.groups.values(): 
+            group.__dict__.pop("stats", None)
+        return stats
+    
+    def start_recording(self, path, chunk_size = 65536, every = 1):
+        '''
+        Params: 
+            path - directory to write the recording to
+            chunk_size - number of rows buffered before they are written
+            every - number of steps between aggregate rows
+        
+        Purpose: Starts streaming group formation, membership and 
+        dissolution events and aggregates to path (see telemetry.py), 
+        existing groups are recorded as formed. Returns the GroupRecorder
+        '''
+        
+        self.recorder = GroupRecorder(self, path, chunk_size, every)
+        for group in self.groups.values(): 
+            group.recorder = self.recorder
+            self.recorder.formed(group)
+        return self.recorder
+    
+    def stop_recording(self):
+        '''
+        Purpose: Writes what is buffered and stops recording
+        '''
+        
+        recorder = self.recorder
+        if recorder != None: 
+            recorder.close()
+            for group in self.groups.values(): 
+                group.__dict__.pop("recorder", None)
+        self.recorder = None
+        return recorder
 
     def get_agent_group(self, agent, link_type):
         '''
@@ -108,6 +264,55 @@ class MultiLevel_Mesa:#(BaseScheduler):
                         
         return group
     
+    def is_alive(self, agent):
+        '''
+        Params: 
+            agent - agent object
+        
+        Purpose: Checks if the agent is still in the master agent dictionary 
+        using its unique_id key, rather than scanning self._agents
+        '''
+        
+        return self._agents.get(agent.unique_id) is agent
+    
+    def filter_alive(self, agents):
+        '''
+        Params: 
+            agents - iterable of agent objects
+        
+        Purpose: Batched version of is_alive, returns list of the agents which
+        are still alive keeping their order
+        '''
+        
+        _agents = self._agents
+        return [agent for agent in agents if _agents.get(agent.unique_id) is agent]
+    
+    def _join_group(self, agent_id, group_type, group_id):
+        '''
+        Params: 
+            agent_id, group_type and group_id of the membership
+        
+        Purpose: Records membership in reverse_groups and group_members so 
+        both indexes stay in sync
+        '''
+        
+        self.reverse_groups[agent_id][group_type].add(group_id)
+        self.group_members[group_id].add(agent_id)
+        
+    def _leave_group(self, agent_id, group_type, group_id):
+        '''
+        Params: 
+            agent_id, group_type and group_id of the membership
+        
+        Purpose: Removes membership from reverse_groups and group_members
+        '''
+        
+        if agent_id in self.reverse_groups.keys(): 
+            self.reverse_groups[agent_id][group_type].discard(group_id)
+        members = self.group_members.get(group_id)
+        if members is not None: 
+            members.discard(agent_id)
+    
     ##########################################
     #
     #  Granular Agent Functions
@@ -127,6 +332,10 @@ class MultiLevel_Mesa:#(BaseScheduler):
             - Master agents by type Dict (self.agents_by_type)        
         '''
         
+        if self._parallel and self._defer(self.add, agent, multi_sched, net): 
+            return
+        if agent.unique_id not in self._agents: 
+            self._agent_count = None
         self._agents[agent.unique_id] = agent
         agent_type = type(agent)
         self.agents_by_type[agent_type][agent.unique_id] = agent
@@ -145,50 +354,103 @@ class MultiLevel_Mesa:#(BaseScheduler):
     #
     ##########################################################
             
-    def _remove_groups_recursion(self, m, group_type):
+    def _drop_group(self, m, group_type):
         '''
         Params: 
-            Group Agent and Group Type, identify where in the reverse group 
-            dictionary the Group agents are
+            Group Agent id and Group Type
             
-        Purpose: Provides a recursive function to remove hierarchies of group
-        agents
+        Purpose: Removes a dissolved group agent from the managers, only 
+        touching the members recorded for it in group_members
         
-        Helper Function for _cache_remove
+        Helper Function for _remove, _remove_groups_cascade and the 
+        reassess functions
         
-        Removes agent from: 
-            - Master agent list (self._agents)
+        Removes group agent from: 
+            - multi_sched
+            - Reverse Groups of its members
+            - Master groups (self.groups)
             - Master agent network (self.net)
-            - Master agents by type Dict (self.agents_by_type)
-            - Schedule
-            - Reverse Groups
         '''
         
         if m in self.multi_sched.keys():
             #remove from multi_sched
             del self.multi_sched[m]
         
-        #remove group agent from all reverse_groups
-        for group_dicts in self.reverse_groups.values():
-            group_dicts[group_type].discard(m)
+        #remove group agent from reverse_groups of its members
+        for a in self.group_members.pop(m, ()):
+            if a in self.reverse_groups.keys():
+                self.reverse_groups[a][group_type].discard(m)
+        
+        #remove from master groups
+        group = self.groups.pop(m)
+        self.group_type_counts[group.group_type] -= 1
+        del self.levels[group.level][m]
+        #remove node is exists
+        if group in self.net:
+            self.net.remove_node(group)
+        if self.streams != None: 
+            self.streams.forget(m)
+        if self.stats != None: 
+            self.stats.dissolved()
+        if self.recorder != None: 
+            self.recorder.dissolved(group)
+            
+        return group
+            
+    def _remove_groups_cascade(self, m, group_type, dissolved):
+        '''
+        Params: 
+            Group Agent and Group Type, identify where in the reverse group 
+            dictionary the Group agents are
+            dissolved - list the unique_ids of the dissolved groups are 
+            appended to
+            
+        Purpose: Removes a dissolved group agent and every super group which 
+        dissolves because of it
+        
+        Helper Function for _cache_remove
+        
+        Concept: 
+            Works through a queue of dissolved groups breadth first rather 
+        than recursing, so hierarchies of any depth can be removed. A group 
+        which is queued more than once is only dropped once.
+        
+        Removes group agents from: 
+            - multi_sched
+            - Reverse Groups
+            - Master groups (self.groups)
+            - Master agent network (self.net)
+            - sub_agents of their super groups
+        '''
         
-        #is group part of larger group
-        if m in self.reverse_groups.keys():
-            #identify super group
-            super_group = self.reverse_groups[m]
+        groups = self.groups
+        reverse_groups = self.reverse_groups
+        group_members = self.group_members
+        queue = deque([(m, group_type)])
+        while queue: 
+            m, group_type = queue.popleft()
+            if m not in groups: 
+                #already dropped
+                continue
+            self._drop_group(m, group_type)
+            dissolved.append(m)
+                    
+            #is group part of larger group
+            super_group = reverse_groups.pop(m, None)
+            if super_group is None: 
+                continue
             for group_agents in super_group.values():
-                #produces a lists of sets of groups
-                for group in self.set_buffer(group_agents): 
-                    super_status, group_remove = self.groups[group].remove(m, self.min) 
+                for group in list(group_agents): 
+                    super_agent = groups.get(group)
+                    if super_agent is None: 
+                        continue
+                    members = group_members.get(group)
+                    if members is not None: 
+                        members.discard(m)
+                    super_status, group_remove = super_agent.remove(m, self.min) 
                     if super_status != None: 
                         #remove super_group
-                        self._remove_groups_recursion(group,group_remove)
-                    
-        #remove from master groups
-        del self.groups[m]
-        #remove node is exists
-        if m in self.net:
-            self.net.remove_node(m)
+                        queue.append((group, group_remove))
     
     
     def _cache_remove(self, agent): 
@@ -197,7 +459,9 @@ class MultiLevel_Mesa:#(BaseScheduler):
         Params:
             agent - single granular agent object
         
-        Supported by _remove_groups_recursion
+        Supported by _remove_groups_cascade
+        
+        Returns: Removed summary of the agent and the groups dissolved
         
         Removes agent from: 
             - Master agent list (self._agents)
@@ -209,7 +473,9 @@ class MultiLevel_Mesa:#(BaseScheduler):
         del self._agents[agent.unique_id]
         agent_class = type(agent)
         del self.agents_by_type[agent_class][agent.unique_id]
+        self._agent_count = None
         self.net.remove_node(agent)
+        dissolved = []
         
         if agent.unique_id in self.reverse_groups.keys():
             _groups = []
@@ -220,6 +486,9 @@ class MultiLevel_Mesa:#(BaseScheduler):
             #delete agent from reverse_group
             del self.reverse_groups[agent.unique_id]
             for m in _groups: 
+                members = self.group_members.get(m)
+                if members is not None: 
+                    members.discard(agent.unique_id)
                 if m in self.groups.keys():
                     if agent.unique_id in self.groups[m].sub_agents.keys():
                         #remove agent from group_agent
@@ -227,11 +496,13 @@ class MultiLevel_Mesa:#(BaseScheduler):
                         #if agent dies
                         if group_status != None:
                             #Helper function to deal with groups within groups
-                            self._remove_groups_recursion(m, group_type)
+                            self._remove_groups_cascade(m, group_type, 
+                                                        dissolved)
              
         if agent.unique_id in self.multi_sched.keys():
             del self.multi_sched[agent.unique_id]
-        #self._remove_groups_recursion.cache_clear()
+        
+        return Removed([agent.unique_id], dissolved)
         
     
     def _remove(self, agent):
@@ -253,7 +524,9 @@ class MultiLevel_Mesa:#(BaseScheduler):
         del self._agents[agent.unique_id]
         agent_class = type(agent)
         del self.agents_by_type[agent_class][agent.unique_id]
+        self._agent_count = None
         self.net.remove_node(agent)
+        dissolved = []
         
         if agent.unique_id in self.reverse_groups.keys():
             _groups = []
@@ -265,30 +538,24 @@ class MultiLevel_Mesa:#(BaseScheduler):
             #delete agent form reverse_groups
             del self.reverse_groups[agent.unique_id]
             for m in _groups: 
+                members = self.group_members.get(m)
+                if members is not None: 
+                    members.discard(agent.unique_id)
                 if m in self.groups.keys():
                     if agent.unique_id in self.groups[m].sub_agents.keys():
                         #remove agent form group_agent
                         group_status, group_type = self.groups[m].remove(agent.unique_id, self.min)
                         #if agent dies
                         if group_status != None:
-                            if m in self.multi_sched.keys():
-                                #remove from multi_sched
-                                del self.multi_sched[m]
-                            #remove group agent from all reverse_groups
-                            #get list of sub_agents in mets
-                            subs = list(self.groups[m].sub_agents.values())
-                            #iterate through subs
-                            for a in subs: 
-                                #get all associated links
-                                 self.reverse_groups[a][group_type].discard(m)
-                            #remove from master group
-                            del self.groups[m]
-                            #remove node is exists
-                            if m in self.net:
-                                self.net.remove_node(m)
+                            #remove group from multi_sched, reverse_groups, 
+                            #groups and net
+                            self._drop_group(m, group_type)
+                            dissolved.append(m)
         
         if agent.unique_id in self.multi_sched.keys():
             del self.multi_sched[agent.unique_id]
+        
+        return Removed([agent.unique_id], dissolved)
   
     
     def remove(self, agent):
@@ -306,14 +573,120 @@ class MultiLevel_Mesa:#(BaseScheduler):
             - multi_sched
             - Reverse Groups        
         
+        Returns: Removed (agents, groups) of the unique_ids removed, None if 
+        the removal is deferred by a parallel step
         '''
+        if self._parallel and self._defer(self.remove, agent): 
+            return
         #calls non-recusursive function
         if self.group_net == False: 
-            self._remove(agent)
+            return self._remove(agent)
         
         #call recursive function    
         else: 
-            self._cache_remove(agent)
+            return self._cache_remove(agent)
+    
+    def add_many(self, agents, multi_sched = True, net = True):
+        '''
+        Params: 
+            agents - iterable of granular agent objects
+            multi_sched, net - as in add
+        
+        Purpose: Batched version of add, the network gets all the agents in
+        one call
+        '''
+        
+        if self._parallel and self._defer(self.add_many, agents, multi_sched,
+                                          net): 
+            return
+        agents = list(agents)
+        _agents = self._agents
+        agents_by_type = self.agents_by_type
+        for agent in agents: 
+            _agents[agent.unique_id] = agent
+            agents_by_type[type(agent)][agent.unique_id] = agent
+            if multi_sched: 
+                self.multi_sched[agent.unique_id] = agent
+        if net: 
+            self.net.add_nodes_from(agents)
+        self._agent_count = None
+    
+    def remove_many(self, agents):
+        '''
+        Params: 
+            agents - iterable of agent objects, agents which are not alive 
+            are skipped
+        
+        Purpose: Batched version of remove
+        
+        Concept: 
+            Every agent is removed from the managers and the network first. 
+        Each group which lost agents then has them removed in one call of 
+        GroupAgent.remove, so a group which loses several agents is only 
+        assessed once. Groups which dissolve are dropped and, with 
+        group_to_net, removed from their super groups the same way, one level 
+        of the hierarchy per pass.
+        
+        Returns: Removed (agents, groups) of the unique_ids removed
+        '''
+        
+        if self._parallel and self._defer(self.remove_many, agents): 
+            return
+        agents = self.filter_alive(agents)
+        removed = Removed([], [])
+        if not agents: 
+            return removed
+        
+        #{group unique_id: [unique_ids of agents it lost]}, in order found
+        lost = {}
+        for agent in agents: 
+            uid = agent.unique_id
+            if uid not in self._agents: 
+                #listed twice
+                continue
+            removed.agents.append(uid)
+            del self._agents[uid]
+            del self.agents_by_type[type(agent)][uid]
+            if uid in self.multi_sched.keys(): 
+                del self.multi_sched[uid]
+            self._lose_member(uid, lost)
+        self._agent_count = None
+        self.net.remove_nodes_from(agents)
+        
+        #one pass per level of the hierarchy
+        while lost: 
+            dissolved = []
+            for m, uids in lost.items(): 
+                group = self.groups.get(m)
+                if group == None: 
+                    continue
+                status, group_type = group.remove(uids, self.min)
+                if status != None: 
+                    dissolved.append((m, group_type))
+            lost = {}
+            for m, group_type in dissolved: 
+                self._drop_group(m, group_type)
+                removed.groups.append(m)
+                if self.group_net: 
+                    self._lose_member(m, lost)
+        
+        return removed
+    
+    def _lose_member(self, uid, lost):
+        '''
+        Helper function for remove_many, takes uid out of reverse_groups and
+        group_members and records the groups it left in lost
+        '''
+        
+        by_type = self.reverse_groups.pop(uid, None)
+        if by_type == None: 
+            return
+        for gids in by_type.values(): 
+            for m in gids: 
+                members = self.group_members.get(m)
+                if members is not None: 
+                    members.discard(uid)
+                lost.setdefault(m, []).append(uid)
                 
     ########################################################################
     #
@@ -321,6 +694,72 @@ class MultiLevel_Mesa:#(BaseScheduler):
     #
     ########################################################################
     
+    def _group_id(self, determine_id, link_type):
+        '''
+        Helper function for _new_group, creates the unique_id of a new group
+        agent
+        '''
+        
+        if determine_id == 'default': 
+            unique_id =  "group"+str(self.id_counter)
+            self.id_counter += 1
+        #determine_id converted to string in net_group function
+        elif str(link_type) in determine_id:
+            unique_id =  determine_id +"_"+str(self.id_counter)
+            self.id_counter += 1
+        else: 
+            unique_id = determine_id
+            
+        return unique_id
+    
+    def _new_group(self, members, links, determine_id, double, policy, 
+                   group_net, link_type):
+        '''
+        Helper function for group_iterate and form_groups_bulk
+        
+        Parameters: 
+            members = agents of the new group
+            links = pairwise agents of the group (tuple or list of tuples)
+            determine_id, double, policy, group_net, link_type as in 
+            group_iterate
+            
+        Purpose: Creates a group agent and adds it to the managers
+        '''
+        
+        unique_id = self._group_id(determine_id, link_type)
+        ma = GroupAgent(unique_id, self.model, self._agents,
+                        dict((x.unique_id, x) for x in members), 
+                        self.reverse_groups, self.min, policy, link_type, 
+                        group_members = self.group_members, 
+                        compact = self.compact_groups,
+                        group_journal = self.group_journal,
+                        streams = self.streams,
+                        levels = self.levels, groups = self.groups)
+        ma.form_graph(links)
+        self.group_journal.record(ma.unique_id)
+        self.group_type_counts[link_type] += 1
+        self.levels[ma.level][ma.unique_id] = ma
+        # add to multi_sched
+        self.multi_sched[ma.unique_id] = ma
+        #add to management structures
+        #Groups ordereddict
+        self.groups[ma.unique_id] = ma
+        for agent in members: 
+            #reverse_groups references
+            self._join_group(agent.unique_id, link_type, ma.unique_id)
+            #remove from multi_sched
+            if double == False and agent.unique_id in self.multi_sched.keys():
+                del self.multi_sched[agent.unique_id]
+        if group_net == True: 
+            self.net.add_node(ma)
+        if self.stats != None: 
+            ma.stats = self.stats
+        if self.recorder != None: 
+            ma.recorder = self.recorder
+            self.recorder.formed(ma)
+            
+        return ma
+    
     def group_iterate(self, groups, determine_id, double, policy, group_net,
                      link_type):
         '''
@@ -340,8 +779,6 @@ class MultiLevel_Mesa:#(BaseScheduler):
         '''
         
         for edge in groups:
-            #create empty dictionary for sub_agents of specific link
-            group2_dict = {}
             #identify if the agents are part of common group
             group_intersect = \
             self.reverse_groups[edge[0].unique_id][link_type].intersection\
@@ -351,42 +788,12 @@ class MultiLevel_Mesa:#(BaseScheduler):
                #neither are part of a group and will create their own
                if  self.reverse_groups[edge[0].unique_id][link_type] == set() and \
                self.reverse_groups[edge[1].unique_id][link_type] == set(): #not part of group_agent
-                   # create new Id
-                   if determine_id == 'default': 
-                       unique_id =  "group"+str(self.id_counter)
-                       self.id_counter += 1
-                   #determine_id converted to string in net_group function
-                   elif str(link_type) in determine_id:
-                       unique_id =  determine_id +"_"+str(self.id_counter)
-                       self.id_counter += 1
-                   else: 
-                       unique_id = determine_id
-                   #create new group agent        
-                   group2_dict = {unique_id: dict((x.unique_id, x) for x in edge)}
-                   
-                   ma = GroupAgent(unique_id, self.model, self._agents,
-                          group2_dict[unique_id], self.reverse_groups, self.min,
-                          policy, link_type)
-                   ma.form_graph(edge)
-                   # add to multi_sched
-                   self.multi_sched[ma.unique_id] = ma
-                   #add to management structures
-                   #Groups ordereddict
-                   self.groups[ma.unique_id] = ma
-                   #reverse_groups references
-                   self.reverse_groups[edge[0].unique_id][link_type].add(ma.unique_id)
-                   self.reverse_groups[edge[1].unique_id][link_type].add(ma.unique_id)
+                   #create new group agent
+                   self._new_group(edge, edge, determine_id, double, policy,
+                                   group_net, link_type)
                    #network if not there
                    if self.net.has_edge(edge[0], edge[1]) == False:
                        self.add_link([edge])
-                   #remove from multi_sched
-                   if double == False: 
-                       if edge[0].unique_id in self.multi_sched.keys():
-                               del self.multi_sched[edge[0].unique_id]
-                       if edge[1].unique_id in self.multi_sched.keys():
-                               del self.multi_sched[edge[1].unique_id]
-                   if group_net == True: 
-                       self.net.add_node(ma)
                #one is part of a group_agent so the other will join
                elif self.reverse_groups[edge[0].unique_id][link_type] == set() or \
                self.reverse_groups[edge[1].unique_id][link_type] == set():  
@@ -399,7 +806,7 @@ class MultiLevel_Mesa:#(BaseScheduler):
                       self.groups[group_a].add([edge[0]]) #GroupAgent add function
                      
                       #add to reverse
-                      self.reverse_groups[edge[0].unique_id][link_type].add(group_a) #set add function
+                      self._join_group(edge[0].unique_id, link_type, group_a)
                       #add to network
                       self.add_link([edge])
                       #delete from multi_sched
@@ -414,7 +821,7 @@ class MultiLevel_Mesa:#(BaseScheduler):
                       self.groups[group_a].add([edge[1]]) #GroupAgent add function
                       
                       #add to reverse
-                      self.reverse_groups[edge[1].unique_id][link_type].add(group_a) #set add function 
+                      self._join_group(edge[1].unique_id, link_type, group_a)
                       #add to network
                       self.add_link([edge])
                       #delete from multi_sched
@@ -430,6 +837,80 @@ class MultiLevel_Mesa:#(BaseScheduler):
                 pass
 
     
+    def form_groups_bulk(self, edges, link_type = None, determine_id = 'default',
+                         double = False, policy = None):
+        '''
+        Bulk version of group_iterate
+        
+        Parameters: 
+            edges = list of bilateral links (agent, agent) to form groups
+            link_type: type of link category to which the groups belong
+            determine_id: parameter to pass in unique_id for group agent
+            double: True of False- remove agent from multi_sched
+            policy: object of group policies toward agents
+            
+        Purpose: Finds the connected components of the whole batch of links
+        with a union find, then creates or extends one group agent per 
+        component in a single pass. A component joins the first existing 
+        group of link_type found among its members, otherwise a new group 
+        agent is formed from the component. As in group_iterate, the 
+        sub_net of the group links every sub_agent to every other and 
+        agents already in another group of link_type stay in that group.
+        
+        Returns list of the group agents formed or extended
+        '''
+        
+        components = UnionFind()
+        agents = {}
+        for edge in edges: 
+            agents[edge[0].unique_id] = edge[0]
+            agents[edge[1].unique_id] = edge[1]
+            components.union(edge[0].unique_id, edge[1].unique_id)
+        
+        #agents of each component keyed by its root
+        members = defaultdict(list)
+        for key, agent in agents.items(): 
+            members[components.find(key)].append(agent)
+        
+        formed = []
+        for component in members.values(): 
+            target = None
+            joiners = []
+            for agent in component: 
+                group_dicts = self.reverse_groups.get(agent.unique_id)
+                current = group_dicts.get(link_type) if group_dicts else None
+                if current: 
+                    if target == None: 
+                        for target in current: 
+                            break
+                else: 
+                    joiners.append(agent)
+            
+            if target == None: 
+                #create new group agent, fully connected as group_iterate 
+                #would build it edge by edge (compact groups are implicitly)
+                if self.compact_groups: 
+                    links = []
+                else: 
+                    links = list(itertools.combinations(component, 2))
+                ma = self._new_group(component, links, determine_id, 
+                                     double, policy, self.group_net, link_type)
+            else: 
+                #agents not in a group join the existing one
+                ma = self.groups[target]
+                if joiners: 
+                    ma.add(joiners) #GroupAgent add function
+                    if double == False: 
+                        for agent in joiners: 
+                            if agent.unique_id in self.multi_sched.keys():
+                                del self.multi_sched[agent.unique_id]
+            formed.append(ma)
+        
+        #network if not there
+        self.net.add_edges_from((edge[0], edge[1]) for edge in edges)
+        
+        return formed
+    
     #########################################################################
     #
     #         Explicit Approach - User Directed GroupAgent Creation
@@ -444,9 +925,7 @@ class MultiLevel_Mesa:#(BaseScheduler):
             Groups agents who should form a group together in a list os tuples
             Checks to ensure agent is still alive   
         '''
-        for agent in agents[:]:
-           if agent not in self._agents.values():
-                agents.remove(agent)
+        agents = self.filter_alive(agents)
         
         if len(agents) <2:
             return None
@@ -461,7 +940,7 @@ class MultiLevel_Mesa:#(BaseScheduler):
     
     def form_group(self, process, *args, determine_id = 'default',
                       double = False, policy = None, group_type = None,
-                      **kwargs):
+                      batch_size = None, **kwargs):
         '''
         Concept: Function works with a user defined process to take in lists of 
         agents who should be grouped together and runs them through the group_agent 
@@ -478,6 +957,9 @@ class MultiLevel_Mesa:#(BaseScheduler):
             double = True or False if agents should be stepped twice during 
             process
             policy = pass in group_agent policy
+            batch_size = None reads the results of process one at a time, 
+            otherwise the number of results read at once (see _form_chunk),
+            the groups formed are the same
             
         Critical Dynamics: 
             process must YIELD agent group
@@ -486,6 +968,15 @@ class MultiLevel_Mesa:#(BaseScheduler):
         
         '''
 
+        if batch_size != None: 
+            results = iter(process(*args, **kwargs))
+            #only one chunk of results is held at a time
+            chunk = list(itertools.islice(results, batch_size))
+            while chunk: 
+                self._form_chunk(chunk, determine_id, double, policy, 
+                                 group_type)
+                chunk = list(itertools.islice(results, batch_size))
+            return
        
         for result in process(*args, **kwargs): 
             if type(result) != tuple:
@@ -506,7 +997,51 @@ class MultiLevel_Mesa:#(BaseScheduler):
             
                    
    
-    def reassess_group(self, process, reintroduce = True, group_type = None, **kwargs):
+    def _form_chunk(self, chunk, determine_id, double, policy, group_type):
+        '''
+        Helper function for form_group with batch_size
+        
+        Purpose: Forms the groups of a chunk of process results in order, 
+        each result on its own as form_group does without batch_size, so 
+        the groups formed do not depend on batch_size. Dead agents are 
+        dropped from every result with filter_alive and results with the 
+        same alive agents as an earlier result of the chunk are skipped. A 
+        result none of whose agents is in a group of group_type yet forms its
+        group in one call of _new_group, the others go through group_iterate.
+        '''
+        
+        seen = set()
+        for result in chunk: 
+            if type(result) == tuple: 
+                group_id, agents = result
+            else: 
+                group_id, agents = determine_id, result
+            agents = self.filter_alive(agents)
+            if len(agents) < 2: 
+                continue
+            key = frozenset(agent.unique_id for agent in agents)
+            if key in seen: 
+                continue
+            seen.add(key)
+            first = agents[0]
+            edges = [(first, agent) for agent in agents[1:]]
+            if any(self.reverse_groups[agent.unique_id][group_type] 
+                   for agent in agents): 
+                self.group_iterate(edges, group_id, double, policy, 
+                                   self.group_net, link_type = group_type)
+                continue
+            #the group group_iterate would build edge by edge
+            members = list(dict.fromkeys(agents))
+            if self.compact_groups: 
+                links = edges
+            else: 
+                links = list(itertools.combinations(members, 2))
+            self._new_group(members, links, group_id, double, policy, 
+                            self.group_net, group_type)
+            self.net.add_edges_from(edges)
+    
+    def reassess_group(self, process, reintroduce = True, group_type = None, 
+                       workers = None, executor = None, **kwargs):
         
         '''
         Purpose: Examine a group agent to remove or add agents and delete if 
@@ -519,68 +1054,102 @@ class MultiLevel_Mesa:#(BaseScheduler):
             shuffled - True or False; do agents need to be in random order
             min_for_group - one more than the smallest number of subagents 
             before a groupagent is deleted
+            workers - number of threads to call process in (see below), None
+            assesses and removes one group at a time
+            executor - concurrent.futures ThreadPoolExecutor to reuse for the
+            process calls, workers is then the number of shards
             
         Critical Dynamics: 
             - process must return 2 agents who are no longer linked
             - group-agents then receives list of agents to remove
             - if group-agent has no subagents it is removed from multi schedule
         
+        With workers or executor the reassessment is done in two phases. 
+        process is first called for every group, split in order into one 
+        shard per worker with each shard in a thread, so every group is 
+        assessed as it was before any removal. The peel lists are then 
+        applied serially in group order, so the result does not depend on
+        thread timing as long as process does not draw from model.random 
+        (the threads would draw in an order set by timing). process should 
+        only read the model, changes it makes to the managers are queued as 
+        in parallel steps and applied last.
+        '''
+        
+        if workers == None and executor == None: 
+            for group_agent in self.reassess_buffer(): 
+                #must receive list of tuples of connected agents
+                self._apply_peel(group_agent, process(group_agent, **kwargs),
+                                 reintroduce, group_type)
+            return
+        
+        groups = list(self.reassess_buffer())
+        results, queues = self._run_shards(
+            lambda shard: [process(group_agent, **kwargs) 
+                           for group_agent in shard], 
+            groups, workers, executor)
+        for group_agent, peel_list in zip(groups, 
+                                          itertools.chain.from_iterable(results)): 
+            #skip groups dissolved by an earlier peel list
+            if self.groups.get(group_agent.unique_id) is group_agent: 
+                self._apply_peel(group_agent, peel_list, reintroduce, 
+                                 group_type)
+        for queue in queues: 
+            for method, args, kwargs in queue: 
+                method(*args, **kwargs)
+    
+    def _apply_peel(self, group_agent, peel_list, reintroduce, group_type):
+        '''
+        Helper function for reassess_group
+        
+        Purpose: Removes the agents of the peel_list returned by the process
+        of reassess_group from group_agent, their links and the managers, 
+        and drops group_agent if too few agents remain
         '''
+        
+        #master list of agents to remove
+        subs_to_remove = []
+        
+        if peel_list != None: 
+             #allows process output to be two agents or 
+             #tuple of two agents
+             if len(peel_list) == 2: 
+                 edges = tuple(peel_list)
+                 
+                 self.net.remove_edge(self._agents[edges[0].unique_id],\
+                                         self._agents[edges[1].unique_id])
+                 #Remove from reverse_group and group_members
+                 for agent in edges: 
+                     self._leave_group(agent.unique_id, group_type, 
+                                       group_agent.unique_id)
+             elif len(peel_list) > 2: 
+                 #Be Default all agents in a group_agent should be
+                 #connected
+                 edges = list(itertools.combinations(peel_list, 2))
+                 self.net.remove_edges_from(edges)
+                 for agent in peel_list: 
+                     self._leave_group(agent.unique_id, group_type, 
+                                       group_agent.unique_id)
+             else: 
+                 raise Exception("Removing subagents from a group",
+                                 "requires either 2 agents ", 
+                                 "or a list of agents. ",)
                 
-        for group_agent in self.reassess_buffer(): 
-            
-            #master list of agents to remove
-            subs_to_remove = []
-             
-            #must receive list of tuples of connected agents
-            peel_list = process(group_agent, **kwargs)
-            if peel_list != None: 
-                 #allows process output to be two agents or 
-                 #tuple of two agents
-                 if len(peel_list) == 2: 
-                     edges = tuple(peel_list)
-                     
-                     self.net.remove_edge(self._agents[edges[0].unique_id],\
-                                             self._agents[edges[1].unique_id])
-                     #Remove from reverse_group, uses set remove function
-                     
-                     
-                     self.reverse_groups[edges[0].unique_id][group_type].remove(group_agent.unique_id)
-                     self.reverse_groups[edges[1].unique_id][group_type].remove(group_agent.unique_id)
-                 elif len(peel_list) > 2: 
-                     #Be Default all agents in a group_agent should be
-                     #connected
-                     edges = list(itertools.combinations(peel_list, 2))
-                     self.net.remove_edges_from(edges)
-                     for edge in edges: 
-                         self.reverse_groups[edges[0].unique_id].remove(group_agent.unique_id)
-                         self.reverse_groups[edges[1].unique_id].remove(group_agent.unique_id)       
-                 else: 
-                     raise Exception("Removing subagents from a group",
-                                     "requires either 2 agents ", 
-                                     "or a list of agents. ",)
-                    
-                 #remove buffer is based on agent id, convert agent list
-                 # to agent ID
-                 for each in peel_list: 
-                     subs_to_remove.append(each.unique_id)
+             #remove buffer is based on agent id, convert agent list
+             # to agent ID
+             for each in peel_list: 
+                 subs_to_remove.append(each.unique_id)
 
-            #function to add independent agent back in 
-            if reintroduce == True and peel_list != None: 
-                for agent in peel_list: 
-                    self.add(agent, multi_sched = True)
-            
-            # call function to remove groupagents if necessary
-            group_status, group_type = group_agent.remove(subs_to_remove, self.min)
-            #Remove group-agents with no sub_agents
-            if group_status != None: 
-                #remove from multi_sched
-                if group_agent.unique_id in self.multi_sched.keys():
-                    del self.multi_sched[group_agent.unique_id]
-                del self.groups[group_agent.unique_id]
-                #iterate through subs
-                for a in subs_to_remove: 
-                   self.reverse_groups[a][group_type].discard(group_agent.unique_id)
+        #function to add independent agent back in 
+        if reintroduce == True and peel_list != None: 
+            for agent in peel_list: 
+                self.add(agent, multi_sched = True)
+        
+        # call function to remove groupagents if necessary
+        group_status, group_remove = group_agent.remove(subs_to_remove, self.min)
+        #Remove group-agents with no sub_agents
+        if group_status != None: 
+            #remove from multi_sched, reverse_groups and groups
+            self._drop_group(group_agent.unique_id, group_remove)
             
         
     #########################################################
@@ -606,11 +1175,8 @@ class MultiLevel_Mesa:#(BaseScheduler):
         '''
         Helper function for reassess functions to manipulate groups dictionary
         '''
-                
-        group_keys = list(self.groups.keys())
-    
-        for key in group_keys: 
-            yield self.groups[key]
+        
+        yield from self.groups.buffer()
     
     def const_buffer(self, agent_type):
         '''
@@ -620,11 +1186,8 @@ class MultiLevel_Mesa:#(BaseScheduler):
         Params: agent_type identfies which agent should be updated
         
         '''
-        const_ids = list(self.agents_by_type[agent_type].keys())
-
-        for agent in const_ids: 
-            if agent in self._agents.keys():
-                  yield self._agents[agent]    
+        
+        yield from self.agents_by_type[agent_type].buffer()
                 
     
     def group_buffer(self, shuffled):
@@ -635,17 +1198,249 @@ class MultiLevel_Mesa:#(BaseScheduler):
         Params: Shuffled - changes order of execution to mitigate mover 
         advantages
         '''
-                
-        group_keys = list(self.multi_sched.keys())
-              
-        if shuffled: 
-            self.model.random.shuffle(group_keys)
         
-        for key in group_keys: 
-            if key in self.multi_sched.keys():
-                yield self.multi_sched[key]
+        if shuffled and self.streams != None: 
+            #None is the key of the main schedule stream
+            yield from self.multi_sched.buffer(True, self.streams.rng(None))
+        else: 
+            yield from self.multi_sched.buffer(shuffled, self.model.random)
+    
+    def group_run(self, make, key, shuffled):
+        '''
+        Purpose: As group_buffer, but steps the agents with their dispatch 
+        plan entries (see ScheduleDict.run)
+        
+        Params: 
+            make - function returning the plan entry of a class of agent
+            key - kind of plan
+            Shuffled - changes order of execution to mitigate mover 
+            advantages
+        '''
+        
+        if shuffled and self.streams != None: 
+            self.multi_sched.run(make, key, True, self.streams.rng(None))
+        else: 
+            self.multi_sched.run(make, key, shuffled, self.model.random)
+    
+    def _plan_entry(self, by_type, const_update):
+        '''
+        Helper function for step
+        
+        Returns the function which makes the plan entry of a class of agent
+        of multi_sched, group_step with the options of step for group 
+        agents, None for the const_update type, which is stepped after the 
+        schedule, otherwise step
+        '''
+        
+        def make(cls):
+            if issubclass(cls, GroupAgent): 
+                if by_type == False: 
+                    return _group_step
+                return methodcaller("group_step", by_type, const_update)
+            if cls == const_update: 
+                return None
+            return _step
+        
+        return make
+    
+    def _step_group(self, agent, by_type, const_update):
+        '''
+        Helper function for step and _parallel_step, executes group_step of a
+        group agent with the by_type and const_update options of step
+        '''
+        
+        if by_type == False: 
+            agent.group_step()
+        else: 
+            #type is list of agents order
+            if const_update == False: 
+                agent.group_step(by_type)
+            else: 
+                agent.group_step(by_type, const_update)
+    
+    def _defer(self, method, *args, **kwargs):
+        '''
+        Helper function for parallel steps
+        
+        Purpose: While group agents are stepped in parallel, changes to the 
+        managers made from a worker thread are queued for that shard rather
+        than applied. Returns True if the call was queued.
+        '''
+        
+        queue = getattr(self._local, "queue", None)
+        if queue == None: 
+            return False
+        queue.append((method, args, kwargs))
+        return True
+    
+    def _run_shards(self, work, items, workers, executor):
+        '''
+        Helper function for _parallel_step and reassess_group
+        
+        Purpose: Splits items in order into one shard per worker and calls 
+        work(shard) for each shard in a thread. Calls to add, remove, 
+        add_link and remove_link made while the shards run are queued per 
+        shard (see _defer). Returns the results of work and the queues, both
+        in shard order, the caller applies the queues. 
+        '''
+        
+        if isinstance(executor, ProcessPoolExecutor): 
+            raise ValueError("Group agents share the model and managers "
+                             "by reference, use a thread pool")
+        if not items: 
+            return [], []
+        if workers == None: 
+            workers = os.cpu_count() or 1
+        size = -(-len(items) // workers)
+        shards = [items[i:i + size] for i in range(0, len(items), size)]
+        queues = [[] for shard in shards]
+        
+        def run(shard, queue): 
+            self._local.queue = queue
+            try: 
+                return work(shard)
+            finally: 
+                self._local.queue = None
+        
+        self._local = threading.local()
+        self._parallel = True
+        try: 
+            if executor == None: 
+                with ThreadPoolExecutor(max_workers = len(shards)) as pool: 
+                    results = list(pool.map(run, shards, queues))
+            else: 
+                results = list(executor.map(run, shards, queues))
+        finally: 
+            self._parallel = False
+            del self._local
+        return results, queues
+    
+    def _parallel_step(self, shuffled, by_type, const_update, workers, executor):
+        '''
+        Purpose: Parallel version of the main loop of step
+        
+        Agents which are not in a group are stepped first in the main thread
+        in schedule order. The group agents are then split in schedule order 
+        into one shard per worker and each shard is stepped in a thread. 
+        Calls to add, remove, add_link and remove_link made while a shard is 
+        stepping are queued and applied once every shard has finished, shard 
+        by shard in the order they were made. The schedules shuffle with 
+        their own streams (see _seed_streams), so the result does not depend
+        on thread timing. 
+        
+        Group agents must have disjoint sub_agents and only read shared state
+        
+        If profiling, the shards are timed as a whole under the groups phase
+        '''
+        
+        stats = self.stats
+        groups = []
+        for agent in self.group_buffer(shuffled):
+            if agent.type != 'group' and type(agent) != const_update: 
+                if stats == None: 
+                    agent.step()
+                else: 
+                    stats.time_agent(agent, "agents")
+            else: 
+                groups.append(agent)
+        if not groups: 
+            return
+        if stats != None: 
+            start = perf_counter()
+        
+        def work(shard): 
+            for agent in shard: 
+                self._step_group(agent, by_type, const_update)
+        
+        results, queues = self._run_shards(work, groups, workers, executor)
+        if stats != None: 
+            stats.current.phases["groups"] += perf_counter() - start
+            stats.current.groups_stepped += len(groups)
+        
+        #apply the queued changes in shard order
+        for queue in queues: 
+            for method, args, kwargs in queue: 
+                method(*args, **kwargs)
+    
+    def _seed_streams(self):
+        '''
+        Purpose: Gives every schedule its own random stream as with 
+        shuffle_seed, seeded from model.random, for parallel steps without 
+        shuffle_seed. Shard threads shuffling with the shared model.random 
+        would step the agents in an order which depends on thread timing. 
+        Later steps, serial or parallel, keep using the streams.
+        '''
+        
+        self.streams = ShuffleStreams(self.model.random.getrandbits(64))
+        self.streams.step = self.steps
+        for group in self.groups.values(): 
+            group.streams = self.streams
+    
+    def _step_level_group(self, agent, by_type, const_update):
+        '''
+        Helper function for _level_step, as _step_group for level_step
+        '''
+        
+        agent.level_step(by_type, const_update)
+    
+    def level_buffer(self, level, shuffled):
+        '''
+        Purpose: Buffer of the group agents at level of the hierarchy
+        
+        Params: 
+            level - level of the level index
+            Shuffled - changes order of execution to mitigate mover 
+            advantages
+        '''
+        
+        groups = self.levels.get(level)
+        if not groups: 
+            return
+        if shuffled and self.streams != None: 
+            #("level", level) is the key of the stream of each level
+            yield from groups.buffer(True, self.streams.rng(("level", level)))
+        else: 
+            yield from groups.buffer(shuffled, self.model.random)
+    
+    def _level_step(self, shuffled, by_type, const_update, order):
+        '''
+        Purpose: Level ordered version of the main loop of step
+        
+        The agents of multi_sched which are not group agents are level 0.
+        Each group agent is stepped once from the level index with 
+        level_step, which steps its sub_agents but not its nested group 
+        agents, as they are stepped from their own level. bottom_up steps 
+        level 0, then level 1 and so on, top_down the reverse. 
+        '''
+        
+        if order not in ("bottom_up", "top_down"): 
+            raise ValueError("order must be 'bottom_up' or 'top_down'")
+        stats = self.stats
+        levels = sorted(k for k, v in self.levels.items() if v)
+        if order == "bottom_up": 
+            levels = [0] + levels
+        else: 
+            levels = levels[::-1] + [0]
+        for level in levels: 
+            if level == 0: 
+                groups = self.groups
+                for agent in self.group_buffer(shuffled):
+                    if agent.unique_id in groups or type(agent) == const_update: 
+                        continue
+                    if stats == None: 
+                        agent.step()
+                    else: 
+                        stats.time_agent(agent, "agents")
+            elif stats == None: 
+                for group in self.level_buffer(level, shuffled):
+                    group.level_step(by_type, const_update)
+            else: 
+                for group in self.level_buffer(level, shuffled):
+                    stats.time_group(self._step_level_group, group, by_type,
+                                     const_update)
     
-    def step(self, shuffled = True, by_type = False, const_update = False):
+    def step(self, shuffled = True, by_type = False, const_update = False,
+             workers = None, executor = None, order = None):
         '''
         Purpose: Step function which executes agent step functions
         
@@ -653,28 +1448,59 @@ class MultiLevel_Mesa:#(BaseScheduler):
             Shuffled: To randomize agent order
             by_type: whether or not agents should be executed in a type order
             const_update: whether agents are updated once per step regardless
+            workers: number of threads to step group agents in parallel 
+            (see _parallel_step), None steps everything serially
+            executor: concurrent.futures ThreadPoolExecutor to reuse for 
+            parallel steps, workers is then the number of shards
+            order: None steps each group agent from multi_sched with its
+            nested groups, 'bottom_up' or 'top_down' steps the hierarchy 
+            level by level (see _level_step)
         '''                
         
-        for agent in self.group_buffer(shuffled):
-            #currently a random activation nested within a random activation 
-            if agent.type != 'group' and type(agent) != const_update: 
-                agent.step()
-            else: 
-                if by_type == False: 
-                    agent.group_step()
+        stats = self.stats
+        if stats != None: 
+            start = perf_counter()
+        if self.streams != None: 
+            self.streams.step = self.steps
+        if order != None: 
+            if workers != None or executor != None: 
+                raise ValueError("Level ordered steps are serial")
+            self._level_step(shuffled, by_type, const_update, order)
+        elif workers != None or executor != None: 
+            if isinstance(executor, ProcessPoolExecutor): 
+                raise ValueError("Group agents share the model and managers "
+                                 "by reference, use a thread pool")
+            if shuffled and self.streams == None: 
+                self._seed_streams()
+            self._parallel_step(shuffled, by_type, const_update, workers, 
+                                executor)
+        elif stats == None: 
+            #currently a random activation nested within a random activation,
+            #the plan is reused until agents join or leave multi_sched
+            self.group_run(self._plan_entry(by_type, const_update),
+                           (by_type, const_update), shuffled)
+        else: 
+            #same as above, timing each agent and group
+            for agent in self.group_buffer(shuffled):
+                if agent.type != 'group' and type(agent) != const_update: 
+                    stats.time_agent(agent, "agents")
                 else: 
-                    #type is list of agents order
-                    if const_update == False: 
-                        agent.group_step(by_type)
-                    else: 
-                        agent.group_step(by_type, const_update)
+                    stats.time_group(self._step_group, agent, by_type, 
+                                     const_update)
                 
         if const_update != False: 
             for agent in self.const_buffer(const_update):
-                agent.step()
+                if stats == None: 
+                    agent.step()
+                else: 
+                    stats.time_agent(agent, "const_update")
 
+        if stats != None: 
+            stats.end_step(self.steps, perf_counter() - start)
         self.steps += 1
         self.time += 1
+        if self.recorder != None: 
+            self.recorder.end_step()
         
         
     ######################################################################
@@ -684,7 +1510,8 @@ class MultiLevel_Mesa:#(BaseScheduler):
     ######################################################################
     
     def net_group(self, link_type = None,link_value = None,
-                     double = False, policy = None):
+                     double = False, policy = None, link_op = None, 
+                     predicates = None, bulk = False):
         '''
         Concept: Updates multi_sched specified by link data either type of
         connection or value
@@ -693,44 +1520,121 @@ class MultiLevel_Mesa:#(BaseScheduler):
           - link_type - activates network with a link that has a specific
                        attribute
           - link_value - activates network with a value of a specific attribute 
+          - link_op - comparison of the link_type attribute to link_value, 
+                      one of graph.OPERATORS, defaults to '==' for strings
+                      and '>=' for values
+          - predicates - list of further (attribute, op, value) conditions
+                         links must all meet
+          - bulk - if True groups are formed from the connected components
+                   of the selected links with form_groups_bulk
           
+        Edges are selected by the graph backend, which extracts each 
+        attribute once and compares them for all edges at once
         '''
         
+        conditions = []
+        if link_type != None and link_value != None: 
+            if link_op == None: 
+                if type(link_value) == str:
+                    link_op = "=="
+                else: 
+                    link_op = ">="
+            conditions.append((link_type, link_op, link_value))
+        if predicates != None: 
+            conditions += list(predicates)
+        
         if link_type != None: 
             if link_value == None: 
-                _groups = []
-                for edge in self.net.edges.data(link_type): 
-                    _groups.append((edge[0], edge[1]))
                 determine_id = str(link_type)
-
             else: 
-                _groups = []
-                for edge in self.net.edges.data(link_type): 
-                    if type(link_value) == str:
-                        if edge[2] == link_value:
-                            _groups.append((edge[0], edge[1]))
-                    elif edge[2] >= link_value: 
-                        _groups.append((edge[0], edge[1]))
-                determine_id = str(link_type)+"_"+str(link_value)        
-                    
-           
-            self.group_iterate(_groups, determine_id, double= double,
-                              policy = policy, group_net = self.group_net,
-                              link_type = link_type)
-            
+                determine_id = str(link_type)+"_"+str(link_value)  
+        else: 
+            determine_id = "default"
         
+        if conditions: 
+            _groups = self.net.select_edges(conditions)
         else: 
             # Add all linked nodes to multi_sched
-            _groups = list(self.net.edges())
-            self.group_iterate(_groups, determine_id = "default", double= double,
+            _groups = self.net.edge_list()
+        
+        if bulk: 
+            self.form_groups_bulk(_groups, link_type, determine_id, 
+                                  double = double, policy = policy)
+        else: 
+            self.group_iterate(_groups, determine_id, double= double,
                               policy = policy, group_net = self.group_net,
                               link_type = link_type)
-            #active_list = []
-            #for group in groups: 
-                
         
+        
+    def _reassess_links(self, group_agent, links, group_type):
+        '''
+        Helper function for reassess_net_group
+        
+        Params: 
+            group_agent - group agent being reassessed
+            links - iterable of pairwise agents of the group agent
+            group_type - reverse_groups key of the group
+            
+        Purpose: Removes agents whose link no longer exists in the master 
+        network from the group agent, returns True if the group dissolved
+        '''
+        
+        for link in links:
+            if self.net.has_edge(link[0], link[1])== False:
+                #remove from reverse group dictionary
+                for agent in link: 
+                    self._leave_group(agent.unique_id, group_type, 
+                                      group_agent.unique_id)
+                #see if group agent should still exist
+                group_status, group_type2 = group_agent.remove([link[0].unique_id, link[1].unique_id], self.min)
+                                    
+                #Remove group-agents with no sub_agents
+                if group_status != None: 
+                    #add individual agent back in multi_sched
+                    for agent in self.filter_alive(link):
+                        self.add(agent, multi_sched = True)
+                    #remove from multi_sched, groups and reverse group
+                    self._drop_group(group_agent.unique_id, group_type2)
+                    return True
+        
+        return False
+    
+    def _changed_net_groups(self, removed, changed):
+        '''
+        Helper function for reassess_net_group
+        
+        Params: 
+            removed - links removed from the master network (journal entries)
+            changed - ids of group agents which gained agents
+        
+        Purpose: Returns dictionary {group id: links to check}, links is None
+        if every link of the group must be checked
+        '''
+        
+        candidates = {}
+        for group_id in changed: 
+            candidates[group_id] = None
+        
+        for u, v in removed: 
+            #link may have been added back since
+            if self.net.has_edge(u, v): 
+                continue
+            groups_u = self.reverse_groups.get(u.unique_id)
+            groups_v = self.reverse_groups.get(v.unique_id)
+            if not groups_u or not groups_v: 
+                continue
+            for group_type, group_ids in groups_u.items(): 
+                common = group_ids.intersection(groups_v.get(group_type, ()))
+                for group_id in common: 
+                    if group_id in candidates.keys() and \
+                    candidates[group_id] == None: 
+                        continue
+                    candidates.setdefault(group_id, []).append((u, v))
+        
+        return candidates
+    
     def reassess_net_group(self, link_type = None,
-                 link_value = None,):
+                 link_value = None, full = False):
         '''
         Concept: Updates group specified by link data either type of 
         connection or value
@@ -739,7 +1643,19 @@ class MultiLevel_Mesa:#(BaseScheduler):
           - link_type - activates network with a link that has a specific
                        attribute
           - link_value - activates network with a value of a specific attribute 
+          - full - True to check every group even if nothing changed
           
+        The first call for a link_type checks every group. After that only
+        the groups with a link removed from the master network (read from 
+        net.journal) or which gained agents (read from group_journal) since 
+        the last call are checked, so the work scales with the change rather
+        than the size of the model. The journals are read once per link_type,
+        a call with another link_value than the last call for its link_type 
+        checks every group, as does a call after the journals dropped 
+        link_type for falling too far behind (see journal.py). Pass 
+        full = True if links were removed in a way the journal cannot see, 
+        for example by replacing self.net. stop_net_journal(link_type) stops
+        recording changes for a link_type no longer reassessed.
         '''
         
         #remove groups who are no longer linked
@@ -751,31 +1667,53 @@ class MultiLevel_Mesa:#(BaseScheduler):
         else:
             group_type = link_type
         
-        for group_agent in self.reassess_buffer(): 
-            for link in group_agent.edge_buffer(link_type, link_value):
-                if self.net.has_edge(link[0], link[1])== False:
-                    #remove from reverse group dictionary
-                    self.reverse_groups[link[0].unique_id][group_type].remove(group_agent.unique_id)
-                    self.reverse_groups[link[1].unique_id][group_type].remove(group_agent.unique_id)
-                    #see if group agent should still exist
-                    group_status, group_type2 = group_agent.remove([link[0].unique_id, link[1].unique_id], self.min)
-                                        
-                    #Remove group-agents with no sub_agents
-                    if group_status != None: 
-                        #add individual agent back in multi_sched
-                        for agent in link:
-                            if agent in self._agents.values():
-                                self.add(agent, multi_sched = True)
-                        #remove from multi_sched
-                        if group_agent.unique_id in self.multi_sched.keys():
-                            del self.multi_sched[group_agent.unique_id]
-                        #remove from group dictionary
-                        del self.groups[group_agent.unique_id]
-                        #iterate through subs and remove from reverse group
-                        for a in link: 
-                           self.reverse_groups[a][group_type].discard(group_agent.unique_id)
+        net_journal = getattr(self.net, "journal", None)
+        removed = None
+        changed = self.group_journal.read(link_type)
+        if net_journal != None: 
+            removed = net_journal.read(link_type)
+            if removed == None: 
+                net_journal.subscribe(link_type)
+        if changed == None: 
+            self.group_journal.subscribe(link_type)
+        #the changes read were only looked at for the last link_value
+        last = self.journal_values.get(link_type, (link_value,))
+        self.journal_values[link_type] = (link_value,)
+        
+        if full or removed == None or changed == None or \
+        ALL_CHANGED in removed or last != (link_value,): 
+            for group_agent in self.reassess_buffer(): 
+                self._reassess_links(group_agent, 
+                                     group_agent.edge_buffer(link_type, link_value),
+                                     group_type)
+            return
+        
+        for group_id, links in self._changed_net_groups(removed, changed).items(): 
+            if group_id not in self.groups.keys(): 
+                continue
+            group_agent = self.groups[group_id]
+            if links == None: 
+                links = group_agent.edge_buffer(link_type, link_value)
+            else: 
+                links = [link for link in links if group_agent.has_sub_edge(*link)]
+            self._reassess_links(group_agent, links, group_type)
                         
                  
+    def stop_net_journal(self, link_type = None): 
+        '''
+        Purpose: Stops the journals recording changes for reassess_net_group 
+        calls of link_type, the next call for link_type checks every group
+        
+        Params: 
+            link_type - link_type passed to reassess_net_group
+        '''
+        
+        self.group_journal.unsubscribe(link_type)
+        net_journal = getattr(self.net, "journal", None)
+        if net_journal != None: 
+            net_journal.unsubscribe(link_type)
+        self.journal_values.pop(link_type, None)
+    
     #TODO make easier to remove based on key, add buffer?
     def add_link(self, agents):     
         '''
@@ -786,6 +1724,8 @@ class MultiLevel_Mesa:#(BaseScheduler):
         
         '''
         
+        if self._parallel and self._defer(self.add_link, agents): 
+            return
         if len(agents) > 2: 
            agents = list(itertools.combinations(agents, 2))
         self.net.add_edges_from(agents)
@@ -798,6 +1738,8 @@ class MultiLevel_Mesa:#(BaseScheduler):
             agents - list of agent objects
         '''
         
+        if self._parallel and self._defer(self.remove_link, agents): 
+            return
         if len(agents) > 2: 
             agents = list(itertools.combinations(agents, 2))
         self.net.remove_edges_from(agents)
@@ -834,14 +1776,46 @@ class GroupAgent(Agent, MultiLevel_Mesa):
     '''
     
     def __init__(self, unique_id, model, agents, sub_agents, reverse_groups,
-                 min_for_group, policy = None, link_type = None, active = True):
+                 min_for_group, policy = None, link_type = None, active = True,
+                 group_members = None, compact = False, group_journal = None,
+                 streams = None, levels = None, groups = None):
         super().__init__(unique_id, model)
         self._agents = agents 
         self.reverse_groups = reverse_groups
-        #sub_agents is dictionary {unique_id:agent_object}
-        self.sub_agents =sub_agents
-        self.subs_by_type = self.make_types(sub_agents)
-        self.sub_net = nx.Graph()
+        #shared forward index of groups to members, kept in sync with 
+        #reverse_groups
+        if group_members == None: 
+            group_members = defaultdict(set)
+        self.group_members = group_members
+        #shared journal of groups which gained agents
+        self.group_journal = group_journal
+        #shared ShuffleStreams if shuffles are seeded
+        self.streams = streams
+        #shared level index of group agents, kept up to date if the level 
+        #changes
+        self.levels = levels
+        #shared master groups, to find the group agents this one is nested in
+        self.groups = groups
+        #sub_agents is dictionary {unique_id:agent_object} tagged by type,
+        #subs_by_type is a view of it
+        self.sub_agents = TaggedScheduleDict(sub_agents)
+        #level of the group in the hierarchy, 1 for a group of agents
+        self.level = 1 + max((agent.level for agent in self.sub_agents.values()
+                              if isinstance(agent, GroupAgent)), default = 0)
+        #compact groups are implicit cliques, they keep only sub_agents and
+        #the pairs of sub_agents whose link was removed, and build sub_net 
+        #on demand
+        self.compact = compact
+        if compact: 
+            self._sub_net = None
+        else: 
+            self._sub_net = nx.Graph()
+        #links absent from the clique of a compact group 
+        #{unique_id: set of unique_ids}
+        self._absent = {}
+        #links of sub_net restored from a checkpoint, built into sub_net 
+        #when it is first needed
+        self._restored_edges = None
         self.min_for_group = min_for_group
         self.policy = self.get_policy(policy)
         self.active = active
@@ -850,6 +1824,51 @@ class GroupAgent(Agent, MultiLevel_Mesa):
         self.__str__ = 'group'
     
    
+    @property
+    def sub_net(self):
+        '''
+        Internal agent graph of the group agent
+        
+        Compact groups build it as a complete graph of the sub_agents 
+        without the absent links the first time it is asked for and maintain
+        it until agents are added, when it is dropped and built again on the
+        next request (so changes made directly to it are lost, use 
+        remove_sub_edge and add_sub_edge). Groups restored from a checkpoint
+        build it from the restored links
+        '''
+        
+        if self._sub_net is None: 
+            if self._restored_edges is None: 
+                graph = nx.complete_graph(list(self.sub_agents.values()))
+                if self._absent: 
+                    sub_agents = self.sub_agents
+                    graph.remove_edges_from(
+                        (sub_agents[u], sub_agents[v]) 
+                        for u, others in self._absent.items() 
+                        for v in others)
+                self._sub_net = graph
+            else: 
+                graph = nx.Graph()
+                graph.add_nodes_from(self.sub_agents.values())
+                graph.add_edges_from(self._restored_edges)
+                self._sub_net = graph
+                self._restored_edges = None
+        return self._sub_net
+    
+    @sub_net.setter
+    def sub_net(self, graph):
+        self._sub_net = graph
+    
+    def _live_net(self):
+        '''
+        Returns sub_net if the group keeps one (building a restored one), 
+        None if the group is implicitly fully connected
+        '''
+        
+        if self._sub_net is None and self._restored_edges is not None: 
+            return self.sub_net
+        return self._sub_net
+    
     def get_policy(self, policy):
        
        if policy == None: 
@@ -863,18 +1882,22 @@ class GroupAgent(Agent, MultiLevel_Mesa):
    #
    ######################################################################
     
+    @property
+    def subs_by_type(self):
+        '''
+        Read only view {type: {unique_id: agent_object}} of sub_agents, 
+        nothing is copied
+        '''
+        return self.make_types(self.sub_agents)
+    
     def make_types(self, sub_agents):
         '''
-        Purpose: Create a dictionary of agents by type
+        Purpose: Create a view of agents by type
         
-        Params: dictionary of sub_agents
+        Params: TaggedScheduleDict of sub_agents
         '''        
         
-        by_type = defaultdict(dict)
-        for k,v in sub_agents.items(): 
-            by_type[type(v)][v.unique_id] = v
-            
-        return by_type
+        return TypeViews(sub_agents)
             
     
     def form_graph(self, links):
@@ -886,6 +1909,10 @@ class GroupAgent(Agent, MultiLevel_Mesa):
             
         '''
         
+        #compact groups are fully connected until sub_net is asked for
+        if self._live_net() is None: 
+            return
+        
         nodes = list(self.sub_agents.values())
         self.sub_net.add_nodes_from(nodes)
         if type(links) == list:
@@ -900,35 +1927,125 @@ class GroupAgent(Agent, MultiLevel_Mesa):
         Params: 
             agents - list of agent objects
         '''        
+        added = []
         for agent in agents: 
             if agent.unique_id not in self.sub_agents.keys(): 
+                added.append(agent)
                 self.sub_agents[agent.unique_id] = agent
-                self.sub_net.add_node(agent)
-                self.subs_by_type[type(agent)][agent.unique_id] = agent
-                self.reverse_groups[agent.unique_id][self.group_type].add(self.unique_id)
-                for agents in self.sub_agents.values(): 
-                    self.sub_net.add_edge(agent, agents)
+                self._join_group(agent.unique_id, self.group_type, self.unique_id)
+        if added: 
+            if self.compact: 
+                #the clique gains the agents implicitly, a built sub_net is 
+                #dropped rather than linked to every sub_agent
+                self._sub_net = None
+                self._restored_edges = None
+            else: 
+                #every added agent is linked to every other sub_agent
+                sub_net = self._live_net()
+                members = list(self.sub_agents.values())
+                sub_net.add_nodes_from(added)
+                sub_net.add_edges_from((agent, member) for agent in added
+                                       for member in members 
+                                       if member is not agent)
+        #record for reassess_net_group that the group gained agents
+        if self.group_journal != None and added: 
+            self.group_journal.record(self.unique_id)
+        #a deeper group joining raises the level
+        level = 1 + max((agent.level for agent in added 
+                         if isinstance(agent, GroupAgent)), default = 0)
+        if level > self.level: 
+            self._relevel()
+        if self.recorder != None and added: 
+            self.recorder.joined(self)
                     
     
-    def remove(self,subs_to_remove, min_for_group, reintroduce = True):
+    def remove(self,subs_to_remove, min_for_group, reintroduce = True, 
+               return_removed = False):
         '''
         Concept - Allows agents to be removed form existing group-agent
         
         Params: 
-            - subs_to_remove list of agent objects
+            - subs_to_remove list, tuple or set of unique_ids of agents, or
+            one unique_id
             - min_for_group -attribute of ML_Mesa class which determines
             how many agents for a minum agent default is 2
+            - return_removed - True adds the list of agent objects removed,
+            in the order of subs_to_remove, to the returned tuple
         '''       
         
         
-        if type(subs_to_remove) != list: 
+        if not isinstance(subs_to_remove, (list, tuple, set, frozenset)): 
             subs_to_remove = [subs_to_remove]
         
+        removed = []
         for key, agent in self.remove_buffer(subs_to_remove):
             
             del self.sub_agents[key]
-            self.sub_net.remove_node(agent)
-            del self.subs_by_type[type(agent)][agent.unique_id]
+            removed.append(agent)
+            for other in self._absent.pop(key, ()): 
+                others = self._absent[other]
+                others.discard(key)
+                if not others: 
+                    del self._absent[other]
+        if removed: 
+            sub_net = self._live_net()
+            if sub_net is not None: 
+                sub_net.remove_nodes_from(removed)
+            if self.recorder != None: 
+                self.recorder.left(self)
+        
+        status, group_type = self._assess_size(min_for_group, reintroduce)
+        #losing its deepest group can lower the level, a group which 
+        #dissolves is dropped instead, so a cascade only relevels the first
+        #group which survives it and that group's ancestors
+        if status == None and any(isinstance(agent, GroupAgent) and 
+                                  agent.level == self.level - 1 
+                                  for agent in removed): 
+            self._relevel()
+        if return_removed: 
+            return status, group_type, removed
+        return status, group_type
+    
+    def _relevel(self):
+        '''
+        Helper function for add and remove
+        
+        Purpose: Sets the level of the group agent to one above its deepest
+        nested group agent, then does the same for each group agent it is 
+        nested in whenever a level changes, working up the hierarchy so 
+        every group agent stays above its sub_agents
+        '''
+        
+        work = deque([self])
+        while work: 
+            group = work.popleft()
+            level = 1 + max((agent.level for agent in group.sub_agents.values()
+                             if isinstance(agent, GroupAgent)), default = 0)
+            if level == group.level: 
+                continue
+            levels = group.levels
+            if levels != None and group.unique_id in levels[group.level]: 
+                del levels[group.level][group.unique_id]
+                levels[level][group.unique_id] = group
+            group.level = level
+            if group.recorder != None: 
+                group.recorder.relevelled(group)
+            #the group agents this one is nested in
+            if group.groups == None: 
+                continue
+            for parents in group.reverse_groups.get(group.unique_id, {}).values(): 
+                for parent in parents: 
+                    if parent in group.groups: 
+                        work.append(group.groups[parent])
+    
+    def _assess_size(self, min_for_group, reintroduce):
+        '''
+        Helper function for remove
+        
+        Purpose: Reports the group as died if it has fewer than 
+        min_for_group sub_agents, placing the remaining agents back in 
+        multi_sched if reintroduce
+        '''
         
         if len(self.sub_agents.keys()) < min_for_group:
             #Place agent back in multi_sched
@@ -937,7 +2054,8 @@ class GroupAgent(Agent, MultiLevel_Mesa):
                     #Mkae sure agents are still alive
                     if agent.unique_id in self._agents.keys():
                         self.model.ml.multi_sched[agent.unique_id] = agent
-                        self.reverse_groups[agent.unique_id][self.group_type].discard(self.unique_id)
+                        self._leave_group(agent.unique_id, self.group_type, 
+                                          self.unique_id)
             #must return group_type to get right dictionary in reverse_groups
             return "died", self.group_type
         else:         
@@ -947,6 +2065,49 @@ class GroupAgent(Agent, MultiLevel_Mesa):
     
     
     
+    def has_sub_edge(self, u, v):
+        '''
+        Concept - Checks if the internal agent graph links u and v without
+        building sub_net for compact groups
+        '''
+        
+        sub_net = self._live_net()
+        if sub_net is None: 
+            return u is not v and u.unique_id in self.sub_agents.keys() \
+                and v.unique_id in self.sub_agents.keys() \
+                and v.unique_id not in self._absent.get(u.unique_id, ())
+        return sub_net.has_edge(u, v)
+    
+    def remove_sub_edge(self, u, v):
+        '''
+        Concept - Removes the link of sub_agents u and v from the internal 
+        agent graph, compact groups record it as absent from the clique
+        '''
+        
+        if self.compact: 
+            self._absent.setdefault(u.unique_id, set()).add(v.unique_id)
+            self._absent.setdefault(v.unique_id, set()).add(u.unique_id)
+        sub_net = self._live_net()
+        if sub_net is not None and sub_net.has_edge(u, v): 
+            sub_net.remove_edge(u, v)
+    
+    def add_sub_edge(self, u, v):
+        '''
+        Concept - Links sub_agents u and v in the internal agent graph, for
+        compact groups this restores a link removed from the clique
+        '''
+        
+        if self.compact: 
+            for a, b in ((u, v), (v, u)): 
+                others = self._absent.get(a.unique_id)
+                if others: 
+                    others.discard(b.unique_id)
+                    if not others: 
+                        del self._absent[a.unique_id]
+        sub_net = self._live_net()
+        if sub_net is not None: 
+            sub_net.add_edge(u, v)
+    
     ######################################################################
     #
     #              Core Step functions and buffers of Sub_Agents
@@ -961,6 +2122,18 @@ class GroupAgent(Agent, MultiLevel_Mesa):
             shuffled - True or False
         '''      
         
+        #compact group without edge data, every pair of sub_agents is linked
+        #unless it is absent
+        if link_type == None and self._live_net() is None: 
+            members = list(self.sub_agents.values())
+            absent = self._absent
+            if not absent: 
+                yield from itertools.combinations(members, 2)
+                return
+            for u, v in itertools.combinations(members, 2): 
+                if v.unique_id not in absent.get(u.unique_id, ()): 
+                    yield u, v
+            return
         
         if link_type != None: 
             if link_value == None: 
@@ -991,14 +2164,11 @@ class GroupAgent(Agent, MultiLevel_Mesa):
             shuffled - True or False
         '''        
         
-        agent_keys = list(self.sub_agents.keys())   
-        
-        if shuffled: 
-            self.model.random.shuffle(agent_keys)
-        
-        for key in agent_keys: 
-            if key in self.sub_agents.keys(): 
-                yield self.sub_agents[key]
+        if shuffled and self.streams != None: 
+            yield from self.sub_agents.buffer(True, 
+                                              self.streams.rng(self.unique_id))
+        else: 
+            yield from self.sub_agents.buffer(shuffled, self.model.random)
         
     
     def remove_buffer(self, subs_to_remove):
@@ -1006,16 +2176,78 @@ class GroupAgent(Agent, MultiLevel_Mesa):
         Concept - Buffer to prevent error from object manipulation
         
         Params: 
-            subs_to_remove - lists of agent objects
+            subs_to_remove - iterable of unique_ids of agents
+        
+        Yields (unique_id, agent object) of the unique_ids which are 
+        sub_agents, once each, looking each one up rather than scanning the
+        sub_agents
         '''
-                
-        agent_keys = list(self.sub_agents.keys())
         
+        sub_agents = self.sub_agents
+        seen = set()
+        for key in subs_to_remove:
+            if key not in seen: 
+                seen.add(key)
+                agent = sub_agents.get(key)
+                if agent is not None: 
+                    yield key, agent
+    
+    
+    def _plan_entry(self, policy):
+        '''
+        Helper function for group_step
+        
+        Returns the function which makes the plan entry of a class of 
+        sub_agent, group_step for nested group agents, otherwise the step of
+        policy or the step of the sub_agent if there is no policy, timed if 
+        profiling
+        '''
+        
+        stats = self.stats
+        
+        def make(cls):
+            is_group = issubclass(cls, GroupAgent)
+            if is_group: 
+                entry = _group_step
+            elif policy != None: 
+                entry = policy.step
+            else: 
+                entry = _step
+            if stats is None: 
+                return entry
+            return partial(stats.time_member, is_group, entry)
         
-        for key in agent_keys:
-            if key in self.sub_agents.keys() and key in subs_to_remove: 
-                yield key, self.sub_agents[key] 
+        return make
     
+    def _timed(self, entry, is_group = False): 
+        '''
+        Helper function for the step functions of the group agent
+        
+        Returns entry, which steps a sub_agent, timed if profiling
+        '''
+        
+        if self.stats is None: 
+            return entry
+        return partial(self.stats.time_member, is_group, entry)
+    
+    def agent_run(self, policy, shuffled = True):
+        '''
+        Concept: As agent_buffer, but steps the sub_agents with their 
+        dispatch plan entries, which are kept until sub_agents or policy 
+        change
+        
+        Params: 
+            policy - policy of the group agent or None
+            shuffled - True or False
+        '''
+        
+        make = self._plan_entry(policy)
+        key = (policy, self.stats)
+        if shuffled and self.streams != None: 
+            self.sub_agents.run(make, key, True, 
+                                self.streams.rng(self.unique_id))
+        else: 
+            self.sub_agents.run(make, key, shuffled, self.model.random)
     
     def agent_by_type_buffer(self, agent_type, shuffled):
         '''
@@ -1026,11 +2258,7 @@ class GroupAgent(Agent, MultiLevel_Mesa):
             shuffled: True = randomize order of agents
         '''
         
-        
-        agent_keys = list(self.subs_by_type[agent_type].keys())
-                
-        for key in agent_keys:
-            yield self.sub_agents[key]
+        yield from self.sub_agents.type_buffer(agent_type)
       
     
     def group_step(self, by_type = False, const_update = False):
@@ -1043,39 +2271,65 @@ class GroupAgent(Agent, MultiLevel_Mesa):
             which is updated constantly
         '''
         
-        if self.policy != None: 
-             
-            self.policy_step(self.policy)
-            
+        policy = self.policy
+        if policy != None and len(self.sub_agents) < self.min_for_group: 
+            #necessary for agent ghost who have not yet been removed from
+            #group_agent but still allive
+            self.policy_step(policy)
+        elif policy != None and hasattr(policy, "step_group"): 
+            if self.level > 1: 
+                group_step = self._timed(_group_step, True)
+                for agent in self.agent_buffer(): 
+                    if isinstance(agent, GroupAgent): 
+                        group_step(agent)
+            self.batch_step(policy)
+        elif by_type == False or policy != None: 
+            self.agent_run(policy)
         else: 
-            if  by_type  == False: 
-                self.step()
-            else: 
-                if const_update == False: 
-                    for agent_type in by_type: 
-                        self.step_by_type(agent_type)
-                else: 
-                    for agent_type in by_type: 
-                        if agent_type == const_update: 
-                            pass
-                        else: 
-                            self.step_by_type(agent_type)
+            make = self._plan_entry(None)
+            key = (None, self.stats)
+            for agent_type in by_type: 
+                if agent_type != const_update: 
+                    self.sub_agents.type_run(agent_type, make, key)
      
     
     
+    def batch_step(self, policy):
+        '''
+        Purpose: Step of a batch policy, calls policy.step_group once with a
+        MemberBatch of the sub_agents which are not group agents and writes
+        the columns it set back to them (see batch.py)
+        
+        Params: 
+            policy - policy object with a step_group method
+        '''
+        
+        if self.level == 1: 
+            members = list(self.sub_agents.values())
+        else: 
+            members = [agent for agent in self.sub_agents.values() 
+                       if not isinstance(agent, GroupAgent)]
+        batch = MemberBatch(members, getattr(policy, "writes", ()))
+        policy.step_group(self, batch)
+        batch.write_back()
+        if self.stats != None: 
+            self.stats.batched(len(members))
+    
     def policy_step(self, policy, shuffled = True):
         
-         
+        group_step = self._timed(_group_step, True)
+        agent_step = self._timed(_step)
+        policy_step = self._timed(policy.step)
         for agent in self.agent_buffer(shuffled):
             if hasattr(agent, "type") and agent.type == 'group':   
-                agent.group_step()
+                group_step(agent)
             else:
                 #necessary for agent ghost who have not yet been removed from
                 #group_agent but still allive
                 if len(self.sub_agents.values()) < self.min_for_group:
-                    agent.step()
+                    agent_step(agent)
                 else:                    
-                    policy.step(agent)
+                    policy_step(agent)
             
         
     
@@ -1086,7 +2340,7 @@ class GroupAgent(Agent, MultiLevel_Mesa):
         
         for agent in self.agent_buffer(shuffled):
             if hasattr(agent, "type") and agent.type == 'group':
-                self.group_step()
+                agent.group_step()
             else:
                 if agent.unique_id in self._agents.keys(): 
                     agent.step()
@@ -1101,19 +2355,53 @@ class GroupAgent(Agent, MultiLevel_Mesa):
         
         for agent in self.agent_by_type_buffer(agent_type, shuffled):
             if hasattr(agent, "type") and agent.type == 'group':
-                self.group_step()
+                agent.group_step()
             else:
                 if agent.unique_id in self._agents.keys(): 
                     agent.step()
-                
-        
-                
-              
-
-        
+    
+    def level_step(self, by_type = False, const_update = False):
+        '''
+        Purpose: Step of the sub_agents of the group agent which are not
+        group agents, used by the level ordered step of MultiLevel_Mesa where
+        nested group agents are stepped from the level index instead
         
+        Params: as group_step
         
-           
+        A level 1 group has no nested group agents so its sub_agents are
+        stepped without checking them, by type the group agent types are
+        skipped once per type rather than once per agent
+        '''
         
-
-            
\ No newline at end of file
+        nested = self.level > 1
+        agent_step = self._timed(_step)
+        if self.policy != None and hasattr(self.policy, "step_group") and \
+        len(self.sub_agents) >= self.min_for_group: 
+            self.batch_step(self.policy)
+        elif self.policy != None: 
+            policy_step = self._timed(self.policy.step)
+            for agent in self.agent_buffer():
+                if nested and isinstance(agent, GroupAgent): 
+                    continue
+                #ghost agents as in policy_step
+                if len(self.sub_agents) < self.min_for_group:
+                    agent_step(agent)
+                else: 
+                    policy_step(agent)
+        elif by_type == False: 
+            alive = self._agents
+            for agent in self.agent_buffer():
+                if nested and isinstance(agent, GroupAgent): 
+                    continue
+                if agent.unique_id in alive: 
+                    agent_step(agent)
+        else: 
+            alive = self._agents
+            for agent_type in by_type: 
+                if agent_type == const_update or (nested and 
+                   isinstance(agent_type, type) and 
+                   issubclass(agent_type, GroupAgent)): 
+                    continue
+                for agent in self.agent_by_type_buffer(agent_type, True):
+                    if agent.unique_id in alive: 
+                        agent_step(agent)
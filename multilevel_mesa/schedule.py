@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Schedule Module
+
+Purpose: Provides the dictionary used by the ML Mesa schedule managers
+(multi_sched, groups, agents_by_type and the GroupAgent sub_agents)
+
+Concept:
+    The buffers of ML Mesa used to copy the keys of a dictionary into a new
+list every time they were called so the dictionary could change during
+execution. ScheduleDict instead keeps a persistent array of its keys in
+insertion order. Deleted keys leave a tombstone in the array which is skipped
+during iteration and the array is compacted once enough tombstones pile up
+and nothing is iterating over it. Shuffled iteration shuffles the indexes of
+the live keys in insertion order, so the order only depends on the keys and
+the random number generator (a pickled or restored dictionary shuffles the
+same way), and refills one array of indexes in place while there are no
+tombstones rather than building a new list.
+    ScheduleDict.run iterates the same way over a plan, a list of the
+functions which step each value aligned with the array of keys. The plan is
+extended as keys are added and only rebuilt when the array is compacted, a
+key is given a new value or the caller asks for a plan of another kind, so
+the step loops do not decide how to step each agent every time.
+
+    TaggedScheduleDict also keeps an array of the type code of each entry, 
+from one registry of classes shared by every dictionary. The sub_agents of
+group agents are tagged, so GroupAgent.subs_by_type is a lazy view of them
+rather than a second dictionary per class holding every member again.
+
+    ShuffleStreams gives every schedule its own random number stream for each
+step, derived from (seed, step, unique_id of the group) with the counter based
+Philox generator of NumPy. The order a group shuffles its agents in then does
+not depend on which groups were shuffled before it, so groups can be stepped
+in any order or in parallel and still reproduce the same run.
+"""
+
+from array import array
+from collections.abc import Mapping
+from hashlib import blake2b
+import threading
+
+import numpy as np
+
+#Marks the slot of a deleted key in ScheduleDict._order
+_TOMB = object()
+
+#Global registry of the classes of the values of TaggedScheduleDict, 
+#{class: code} and the classes by code
+_TYPE_CODES = {}
+_TYPES = []
+_TYPE_LOCK = threading.Lock()
+#TaggedScheduleDict._kind of a dictionary with values of several classes
+_MIXED = -1
+
+
+class ScheduleDict(dict):
+    '''
+    ScheduleDict
+
+    Dictionary {unique_id: agent_object} which supports insertion and deletion
+    while it is being iterated through buffer
+
+    Entries deleted during iteration are skipped, entries added during
+    iteration are not visited until the next call of buffer
+    '''
+
+    #Tombstones are not compacted until they are this many
+    min_compact = 16
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        #Keys in insertion order, deleted keys are replaced with _TOMB
+        self._order = []
+        #Index of each key in _order
+        self._slots = {}
+        #Array of indexes into _order reused by shuffles, built on first 
+        #shuffle
+        self._perm = None
+        #Number of tombstones in _order
+        self._dead = 0
+        #Number of active buffers, no compaction while above 0
+        self._iterating = 0
+        #Dispatch plan aligned with _order, its key and the epoch it was
+        #built in, the epoch changes whenever slots of _order are reused
+        self._plan = None
+        self._plan_key = None
+        self._plan_epoch = 0
+        self._epoch = 0
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        if not dict.__contains__(self, key):
+            self._slots[key] = len(self._order)
+            self._order.append(key)
+        elif dict.__getitem__(self, key) is not value:
+            #the plan entry of key was made for the old value
+            self._epoch += 1
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._order[self._slots.pop(key)] = _TOMB
+        self._dead += 1
+        if self._iterating == 0 and self._dead > self.min_compact and \
+        self._dead * 2 > len(self._order):
+            self._compact()
+
+    def __reduce__(self):
+        #items are set after the dictionary is memoized, so values which
+        #refer back to it (e.g. GroupAgent.groups) pickle without recursing
+        return (self.__class__, (), None, None, iter(self.items()))
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default = None):
+        if not dict.__contains__(self, key):
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if dict.__contains__(self, key):
+            value = dict.__getitem__(self, key)
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        for key in reversed(self._order):
+            if key is not _TOMB:
+                return key, self.pop(key)
+        raise KeyError("popitem(): dictionary is empty")
+
+    def clear(self):
+        dict.clear(self)
+        if self._iterating:
+            #active buffers hold _order, so tombstone it in place
+            for i in range(len(self._order)):
+                self._order[i] = _TOMB
+            self._dead = len(self._order)
+        else:
+            self._order = []
+            self._perm = None
+            self._dead = 0
+            self._epoch += 1
+        self._slots = {}
+
+    def copy(self):
+        return self.__class__(self)
+
+    def _compact(self):
+        '''
+        Purpose: Removes tombstones from _order in place and re-indexes the
+        moved keys
+        '''
+
+        order = self._order
+        slots = self._slots
+        i = 0
+        for key in order:
+            if key is not _TOMB:
+                order[i] = key
+                slots[key] = i
+                i += 1
+        del order[i:]
+        self._perm = None
+        self._dead = 0
+        self._epoch += 1
+
+    def _permutation(self, end, shuffled, rng):
+        '''
+        Returns the indexes of _order up to end in the order to visit them,
+        shuffled from insertion order with tombstones left out
+        '''
+
+        if not shuffled:
+            return range(end)
+        order = self._order
+        if self._dead:
+            perm = [i for i in range(end) if order[i] is not _TOMB]
+        elif self._iterating:
+            #nested buffer, the outer one is still using _perm
+            perm = list(range(end))
+        elif self._perm is None:
+            perm = self._perm = list(range(end))
+        else:
+            perm = self._perm
+            perm[:] = range(end)
+        rng.shuffle(perm)
+        return perm
+
+    def buffer(self, shuffled = False, rng = None):
+        '''
+        Purpose: Yields values of the dictionary while allowing the dictionary
+        to change
+
+        Params:
+            shuffled - True or False; randomizes the order of the values
+            rng - random number generator with a shuffle method, needed if
+            shuffled
+        '''
+
+        if self._iterating == 0 and self._dead * 4 > len(self._order):
+            self._compact()
+        order = self._order
+        perm = self._permutation(len(order), shuffled, rng)
+
+        get = dict.__getitem__
+        self._iterating += 1
+        try:
+            for i in perm:
+                key = order[i]
+                if key is not _TOMB:
+                    yield get(self, key)
+        finally:
+            self._iterating -= 1
+
+    def run(self, make, key = None, shuffled = False, rng = None):
+        '''
+        Purpose: Calls the plan entry of each value with the value, in the
+        order of buffer and allowing the dictionary to change the same way
+
+        Params:
+            make - function of a class returning the function which steps a
+            value of that class, or None to skip values of that class
+            key - kind of plan, the plan is rebuilt if key differs from the
+            key of the current plan
+            shuffled, rng - as buffer
+
+        The plan holds one entry per slot of _order, made once per class, so
+        building it allocates no objects per value
+        '''
+
+        if self._iterating == 0 and self._dead * 4 > len(self._order):
+            self._compact()
+        end = len(self._order)
+        plan = self._plan
+        if plan is None or len(plan) < end or self._plan_key != key or \
+        self._plan_epoch != self._epoch:
+            plan = self._plan_for(make, key)
+        self._call(plan, self._permutation(end, shuffled, rng))
+
+    def _plan_for(self, make, key):
+        '''
+        Returns the plan of key, built or extended up to the end of _order
+        '''
+
+        order = self._order
+        end = len(order)
+        plan = self._plan
+        if plan is None or self._plan_epoch != self._epoch or \
+        self._plan_key != key:
+            #a new list, so a plan being run is left as it is
+            plan = self._plan = []
+            self._plan_key = key
+            self._plan_epoch = self._epoch
+        if len(plan) < end:
+            get = dict.__getitem__
+            kinds = {}
+            for k in order[len(plan):end]:
+                if k is _TOMB:
+                    plan.append(None)
+                    continue
+                cls = type(get(self, k))
+                if cls not in kinds:
+                    kinds[cls] = make(cls)
+                plan.append(kinds[cls])
+        return plan
+
+    def _call(self, plan, slots):
+        '''
+        Calls the plan entries of the live values in slots of _order
+        '''
+
+        order = self._order
+        get = dict.__getitem__
+        self._iterating += 1
+        try:
+            for i in slots:
+                entry = plan[i]
+                if entry is not None:
+                    k = order[i]
+                    if k is not _TOMB:
+                        entry(get(self, k))
+        finally:
+            self._iterating -= 1
+
+
+def type_code(cls):
+    '''
+    Returns the integer code of cls in the global type registry, 
+    registering cls if it is new
+    '''
+
+    code = _TYPE_CODES.get(cls)
+    if code is None:
+        with _TYPE_LOCK:
+            code = _TYPE_CODES.get(cls)
+            if code is None:
+                code = _TYPE_CODES[cls] = len(_TYPES)
+                _TYPES.append(cls)
+    return code
+
+
+class TaggedScheduleDict(ScheduleDict):
+    '''
+    TaggedScheduleDict
+
+    ScheduleDict which also keeps the type code of each value aligned with
+    the array of keys, so the values of one class are found with a NumPy
+    comparison rather than a dictionary per class
+
+    Used for the sub_agents of group agents, GroupAgent.subs_by_type is a
+    TypeViews of it
+    '''
+
+    #Below this many slots the slots of a class are found without NumPy
+    min_vector = 64
+
+    def __init__(self, *args, **kwargs):
+        #type code of the value in each slot of _order
+        self._tags = array("H")
+        #code of every tag while there is only one, otherwise _MIXED
+        self._kind = None
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        slot = self._slots.get(key)
+        super().__setitem__(key, value)
+        code = type_code(type(value))
+        if slot is None:
+            self._tags.append(code)
+        else:
+            self._tags[slot] = code
+        if self._kind != code:
+            self._kind = code if self._kind is None else _MIXED
+
+    def clear(self):
+        iterating = self._iterating
+        super().clear()
+        if not iterating:
+            self._tags = array("H")
+            self._kind = None
+
+    def _compact(self):
+        tags = self._tags
+        self._tags = array("H", (tags[i] for i, key in enumerate(self._order)
+                                 if key is not _TOMB))
+        kinds = set(self._tags)
+        if len(kinds) < 2:
+            self._kind = kinds.pop() if kinds else None
+        else:
+            self._kind = _MIXED
+        super()._compact()
+
+    def type_slots(self, cls):
+        '''
+        Returns the slots of _order holding values of class cls (dead slots
+        included) in insertion order
+        '''
+
+        code = _TYPE_CODES.get(cls)
+        kind = self._kind
+        if code is None or kind is None:
+            return ()
+        if kind == code:
+            #every value is of class cls
+            return range(len(self._tags))
+        if kind != _MIXED:
+            return ()
+        tags = self._tags
+        if len(tags) < self.min_vector:
+            return [i for i, tag in enumerate(tags) if tag == code]
+        #the view of _tags is dropped before the array can grow again
+        return np.flatnonzero(np.frombuffer(tags, dtype = np.uint16)
+                              == code).tolist()
+
+    def types(self):
+        '''
+        Returns the classes of the values in order of first appearance
+        '''
+
+        return list(dict.fromkeys(type(value) for value in self.values()))
+
+    def type_buffer(self, cls):
+        '''
+        Purpose: As buffer (not shuffled) for the values of class cls
+        '''
+
+        if self._iterating == 0 and self._dead * 4 > len(self._order):
+            self._compact()
+        order = self._order
+        get = dict.__getitem__
+        self._iterating += 1
+        try:
+            for i in self.type_slots(cls):
+                key = order[i]
+                if key is not _TOMB:
+                    yield get(self, key)
+        finally:
+            self._iterating -= 1
+
+    def type_run(self, cls, make, key = None):
+        '''
+        Purpose: As run (not shuffled) for the values of class cls
+        '''
+
+        if self._iterating == 0 and self._dead * 4 > len(self._order):
+            self._compact()
+        plan = self._plan
+        if plan is None or len(plan) < len(self._order) or \
+        self._plan_key != key or self._plan_epoch != self._epoch:
+            plan = self._plan_for(make, key)
+        self._call(plan, self.type_slots(cls))
+
+
+class TypeView(Mapping):
+    '''
+    TypeView
+
+    Read only view {unique_id: agent_object} of the values of one class of
+    a TaggedScheduleDict, nothing is copied
+    '''
+
+    __slots__ = ("_sched", "_type")
+
+    def __init__(self, sched, cls):
+        self._sched = sched
+        self._type = cls
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self._sched, key)
+        if type(value) is not self._type:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return type(self._sched.get(key, _TOMB)) is self._type
+
+    def __iter__(self):
+        order = self._sched._order
+        for i in self._sched.type_slots(self._type):
+            key = order[i]
+            if key is not _TOMB:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def buffer(self, shuffled = False, rng = None):
+        return self._sched.type_buffer(self._type)
+
+    def run(self, make, key = None):
+        self._sched.type_run(self._type, make, key)
+
+
+class TypeViews(Mapping):
+    '''
+    TypeViews
+
+    Read only view {class: TypeView} of a TaggedScheduleDict, like a 
+    defaultdict a class without values gives an empty TypeView
+    '''
+
+    __slots__ = ("_sched",)
+
+    def __init__(self, sched):
+        self._sched = sched
+
+    def __getitem__(self, cls):
+        return TypeView(self._sched, cls)
+
+    def __contains__(self, cls):
+        return cls in self._sched.types()
+
+    def __iter__(self):
+        return iter(self._sched.types())
+
+    def __len__(self):
+        return len(self._sched.types())
+
+
+class ShuffleStreams:
+    '''
+    ShuffleStreams
+
+    Source of the per schedule random number streams used for seeded
+    shuffling, shared by a MultiLevel_Mesa instance and its group agents
+
+    The stream of a schedule is a Philox generator keyed by a hash of
+    (seed, unique_id) whose counter starts at the current step, so streams
+    are independent of each other and of the order they are asked for
+    '''
+
+    def __init__(self, seed):
+        self.seed = seed
+        #set by MultiLevel_Mesa.step before any agent is stepped
+        self.step = 0
+        #{unique_id: Philox key}
+        self._keys = {}
+
+    def key(self, unique_id):
+        '''
+        Returns the 128 bit Philox key of unique_id as two 64 bit words
+        '''
+
+        key = self._keys.get(unique_id)
+        if key is None:
+            digest = blake2b(repr((self.seed, unique_id)).encode(),
+                             digest_size = 16).digest()
+            key = self._keys[unique_id] = np.frombuffer(digest,
+                                                        dtype = np.uint64)
+        return key
+
+    def rng(self, unique_id):
+        '''
+        Returns the generator of unique_id for the current step
+        '''
+
+        return np.random.Generator(np.random.Philox(
+            key = self.key(unique_id), counter = [0, 0, 0, self.step]))
+
+    def forget(self, unique_id):
+        self._keys.pop(unique_id, None)
+
+    def __getstate__(self):
+        #keys are rebuilt on demand
+        return {"seed": self.seed, "step": self.step, "_keys": {}}
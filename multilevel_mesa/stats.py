@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Stats Module
+
+Purpose: Provides StepStats, the optional profiler of MultiLevel_Mesa.step
+
+Concept:
+    MultiLevel_Mesa.stats is None unless profiling is enabled with
+MultiLevel_Mesa.enable_stats, so a model which does not profile only pays for
+one check per step and per dissolved group. When enabled each step is split
+into phases:
+    agents - step of the agents which are not in a group
+    groups - group_step of group agents without a policy
+    policies - group_step of group agents with a policy
+    const_update - step of the agents updated once per step
+Group times include the steps of their sub_agents. Time is also kept per
+class name of the agents stepped, including the sub_agents stepped by group
+agents, and per class name of the policies, along with counts of agents
+stepped, groups stepped and groups dissolved. The time of a class only
+counts what its agents spend outside the timed steps they make, so the time
+of a group agent is its policy and overhead without its sub_agents, and the
+members of batch policies are counted but timed with their group agent.
+
+Each step is recorded into StepStats.current, which is added to the totals
+and passed to the callback (if any) once the step finishes. Groups dissolved
+between steps (e.g. by reassess_group) are counted in the next step.
+"""
+
+from collections import defaultdict
+import threading
+from time import perf_counter
+
+PHASES = ("agents", "groups", "policies", "const_update")
+
+
+class StepRecord:
+    '''
+    StepRecord
+
+    Times (seconds) and counts of one or more steps
+    '''
+
+    __slots__ = ("step", "time", "phases", "agents_stepped",
+                 "groups_stepped", "groups_dissolved", "by_type",
+                 "by_policy")
+
+    def __init__(self, step = None):
+        self.step = step
+        self.time = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.agents_stepped = 0
+        self.groups_stepped = 0
+        self.groups_dissolved = 0
+        self.by_type = defaultdict(float)
+        self.by_policy = defaultdict(float)
+
+    def merge(self, other):
+        '''
+        Adds the times and counts of other to this record
+        '''
+
+        self.time += other.time
+        for phase, seconds in other.phases.items():
+            self.phases[phase] += seconds
+        self.agents_stepped += other.agents_stepped
+        self.groups_stepped += other.groups_stepped
+        self.groups_dissolved += other.groups_dissolved
+        for name, seconds in other.by_type.items():
+            self.by_type[name] += seconds
+        for name, seconds in other.by_policy.items():
+            self.by_policy[name] += seconds
+
+    def as_dict(self):
+        return {"step": self.step, "time": self.time,
+                "phases": dict(self.phases),
+                "agents_stepped": self.agents_stepped,
+                "groups_stepped": self.groups_stepped,
+                "groups_dissolved": self.groups_dissolved,
+                "by_type": dict(self.by_type),
+                "by_policy": dict(self.by_policy)}
+
+
+class StepStats:
+    '''
+    StepStats
+
+    Totals of every profiled step plus the record of the step in progress
+
+    Params:
+        callback - function called with the StepRecord of each step once it
+        finishes
+    '''
+
+    def __init__(self, callback = None):
+        self.callback = callback
+        #sub_agents of parallel steps are timed in several threads
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.totals = StepRecord()
+        self.current = StepRecord()
+
+    def _timed(self, call, *args):
+        '''
+        Calls call(*args), returns the seconds it took with and without the
+        timed calls it made
+        '''
+
+        local = self._local
+        outer = getattr(local, "inner", 0.0)
+        local.inner = 0.0
+        start = perf_counter()
+        try:
+            call(*args)
+        finally:
+            seconds = perf_counter() - start
+            own = seconds - local.inner
+            local.inner = outer + seconds
+        return seconds, own
+
+    def time_agent(self, agent, phase):
+        '''
+        Steps agent, timing it under phase and its class name
+        '''
+
+        seconds, own = self._timed(agent.step)
+        with self._lock:
+            current = self.current
+            current.phases[phase] += seconds
+            current.by_type[type(agent).__name__] += own
+            current.agents_stepped += 1
+
+    def time_group(self, step_group, agent, by_type, const_update):
+        '''
+        Steps group agent with step_group, timing it under its policy class
+        name if it has a policy
+        '''
+
+        seconds, own = self._timed(step_group, agent, by_type, const_update)
+        with self._lock:
+            current = self.current
+            current.by_type[type(agent).__name__] += own
+            if agent.policy != None:
+                current.phases["policies"] += seconds
+                current.by_policy[type(agent.policy).__name__] += seconds
+            else:
+                current.phases["groups"] += seconds
+            current.groups_stepped += 1
+
+    def time_member(self, is_group, entry, agent):
+        '''
+        Steps sub_agent agent of a group agent with entry, timing it under
+        its class name, is_group is True if agent is a group agent
+        '''
+
+        seconds, own = self._timed(entry, agent)
+        with self._lock:
+            current = self.current
+            current.by_type[type(agent).__name__] += own
+            if is_group:
+                current.groups_stepped += 1
+            else:
+                current.agents_stepped += 1
+
+    def batched(self, count):
+        '''
+        Counts the count members of a batch policy step as stepped
+        '''
+
+        with self._lock:
+            self.current.agents_stepped += count
+
+    def dissolved(self):
+        with self._lock:
+            self.current.groups_dissolved += 1
+
+    def end_step(self, step, seconds):
+        '''
+        Closes the record of step, adds it to the totals and streams it to
+        the callback
+        '''
+
+        record = self.current
+        record.step = step
+        record.time = seconds
+        self.totals.merge(record)
+        self.steps += 1
+        self.current = StepRecord()
+        if self.callback != None:
+            self.callback(record)
+        return record
+
+    def as_dict(self):
+        totals = self.totals.as_dict()
+        totals["steps"] = self.steps
+        del totals["step"]
+        return totals
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"], state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
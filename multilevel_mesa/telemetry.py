@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Telemetry Module
+
+Purpose: Provides GroupRecorder, which streams the formation, growth and
+dissolution of group agents to disk
+
+Concept:
+    MultiLevel_Mesa.recorder is None unless recording is started with
+MultiLevel_Mesa.start_recording. While recording, the group helpers report
+each change of a group agent as it happens:
+    formed - _new_group (group_iterate, form_groups_bulk)
+    joined - GroupAgent.add
+    left - GroupAgent.remove
+    dissolved - _drop_group (remove, reassess and the recursive removal)
+Each event is one row of (step, kind, group, uid, size, depth, lifetime),
+where group is a serial number given to the group when it formed, size the
+number of sub_agents after the event, depth the level of the group in the
+hierarchy (GroupAgent.level) and lifetime the steps since formation.
+The recorder keeps running totals of groups, sub_agents and depths from
+these events, so the aggregates written every few steps (agent_count,
+active_agent_count, groups, mean group size, max depth) cost O(1) rather
+than a walk of the managers.
+
+Rows are buffered in NumPy arrays of chunk_size rows and each full chunk is
+written as its own NPZ file (events-000000.npz, aggregates-000000.npz, ...)
+in the recording directory, so memory stays bounded however long the run.
+read_chunks joins the chunks back together.
+"""
+
+from collections import Counter
+import glob
+import os
+
+import numpy as np
+
+#Event kinds
+FORMED = 0
+JOINED = 1
+LEFT = 2
+DISSOLVED = 3
+
+_EVENT_COLUMNS = (("step", np.int64), ("kind", np.int8),
+                  ("group", np.int64), ("size", np.int64),
+                  ("depth", np.int16), ("lifetime", np.int64))
+_AGGREGATE_COLUMNS = (("step", np.int64), ("agent_count", np.int64),
+                      ("active_agent_count", np.int64),
+                      ("groups", np.int64), ("mean_group_size", np.float64),
+                      ("max_depth", np.int16))
+
+
+class _ChunkWriter:
+    '''
+    Buffer of rows of fixed columns which writes itself to a new NPZ file
+    each time it fills up
+    '''
+
+    def __init__(self, path, prefix, columns, chunk_size, strings = ()):
+        self.path = path
+        self.prefix = prefix
+        self.columns = {name: np.empty(chunk_size, dtype = dtype)
+                        for name, dtype in columns}
+        #string columns are kept as lists until written
+        self.strings = {name: [] for name in strings}
+        self.chunk_size = chunk_size
+        self.n = 0
+        self.chunks = 0
+
+    def append(self, row, strings = ()):
+        n = self.n
+        for column, value in zip(self.columns.values(), row):
+            column[n] = value
+        for column, value in zip(self.strings.values(), strings):
+            column.append(value)
+        self.n = n + 1
+        if self.n == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.n == 0:
+            return
+        data = {name: column[:self.n] for name, column in self.columns.items()}
+        for name, column in self.strings.items():
+            data[name] = np.array(column, dtype = str)
+            column.clear()
+        np.savez(os.path.join(self.path, "%s-%06d.npz" % (self.prefix,
+                                                          self.chunks)),
+                 **data)
+        self.chunks += 1
+        self.n = 0
+
+
+class GroupRecorder:
+    '''
+    GroupRecorder
+
+    Params:
+        ml - MultiLevel_Mesa instance to record
+        path - directory the chunks are written to, created if needed
+        chunk_size - rows buffered before a chunk is written
+        every - steps between aggregate rows
+    '''
+
+    def __init__(self, ml, path, chunk_size = 65536, every = 1):
+        self.ml = ml
+        self.every = every
+        os.makedirs(path, exist_ok = True)
+        self.events = _ChunkWriter(path, "events", _EVENT_COLUMNS,
+                                   chunk_size, strings = ("uid",))
+        self.aggregates = _ChunkWriter(path, "aggregates",
+                                       _AGGREGATE_COLUMNS, chunk_size)
+        #{group unique_id: [serial, step formed, depth, size]}
+        self.live = {}
+        self.serial = 0
+        #running totals of the live groups
+        self.members = 0
+        self.depths = Counter()
+
+    def _event(self, kind, group, info, uid = ""):
+        step = self.ml.steps
+        self.events.append((step, kind, info[0], info[3], info[2],
+                            step - info[1]), (uid,))
+
+    def formed(self, group):
+        depth = group.level
+        size = len(group.sub_agents)
+        info = self.live[group.unique_id] = [self.serial, self.ml.steps,
+                                             depth, size]
+        self.serial += 1
+        self.members += size
+        self.depths[depth] += 1
+        self._event(FORMED, group, info, str(group.unique_id))
+
+    def joined(self, group):
+        info = self.live.get(group.unique_id)
+        if info == None:
+            return
+        size = len(group.sub_agents)
+        self.members += size - info[3]
+        info[3] = size
+        self.relevelled(group)
+        self._event(JOINED, group, info)
+
+    def left(self, group):
+        info = self.live.get(group.unique_id)
+        if info == None:
+            return
+        size = len(group.sub_agents)
+        self.members += size - info[3]
+        info[3] = size
+        self._event(LEFT, group, info)
+
+    def relevelled(self, group):
+        '''
+        Moves group to its new depth, levels change when nested groups join
+        or leave it or a group nested in it
+        '''
+
+        info = self.live.get(group.unique_id)
+        if info == None or group.level == info[2]:
+            return
+        self.depths[info[2]] -= 1
+        if self.depths[info[2]] == 0:
+            del self.depths[info[2]]
+        self.depths[group.level] += 1
+        info[2] = group.level
+
+    def dissolved(self, group):
+        info = self.live.pop(group.unique_id, None)
+        if info == None:
+            return
+        self.members -= info[3]
+        self.depths[info[2]] -= 1
+        if self.depths[info[2]] == 0:
+            del self.depths[info[2]]
+        self._event(DISSOLVED, group, info)
+
+    def end_step(self):
+        '''
+        Writes an aggregate row if the step is a multiple of every
+        '''
+
+        ml = self.ml
+        if ml.steps % self.every:
+            return
+        groups = len(self.live)
+        self.aggregates.append((ml.steps, len(ml._agents),
+                                len(ml.multi_sched), groups,
+                                self.members / groups if groups else 0.0,
+                                max(self.depths, default = 0)))
+
+    def close(self):
+        self.events.flush()
+        self.aggregates.flush()
+
+
+def read_chunks(path, prefix = "events"):
+    '''
+    Params:
+        path - recording directory
+        prefix - "events" or "aggregates"
+
+    Returns: dictionary of the columns of every chunk joined in order
+    '''
+
+    files = sorted(glob.glob(os.path.join(path, prefix + "-*.npz")))
+    chunks = []
+    for name in files:
+        with np.load(name) as data:
+            chunks.append({key: data[key] for key in data.files})
+    if not chunks:
+        return {}
+    return {key: np.concatenate([chunk[key] for chunk in chunks])
+            for key in chunks[0]}
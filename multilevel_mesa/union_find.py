@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+ML Mesa Union Find Module
+
+Purpose: Provides the disjoint set structure MultiLevel_Mesa.form_groups_bulk
+uses to find the connected components of a batch of links
+"""
+
+
+class UnionFind:
+    '''
+    UnionFind
+
+    Disjoint sets of hashable keys with union by size and path halving
+    '''
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, key):
+        '''
+        Returns the root key of the set of key, adding key if it is new
+        '''
+
+        parent = self.parent
+        if key not in parent:
+            parent[key] = key
+            self.size[key] = 1
+            return key
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(self, a, b):
+        '''
+        Merges the sets of a and b, returns the root of the merged set
+        '''
+
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size.pop(b)
+        return a
@@ -35,5 +35,5 @@ setup(
     keywords='agent based modeling model ABM simulation multi-agent coaltion game theory',
     packages = ["multilevel_mesa"],
     #for more elaborate projects with directories of files such as tests etc
-    install_requires=['networkx', "mesa"]
+    install_requires=['networkx', "mesa", "numpy"]
 )
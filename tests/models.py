@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Models shared by the multilevel_mesa tests
+"""
+
+from mesa import Agent, Model
+
+import multilevel_mesa as mlm
+
+
+class LogAgent(Agent):
+    '''
+    Agent which records every activation in the log of its model
+    '''
+
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+        self.type = 'agent'
+        self.wealth = 1
+
+    def step(self):
+        self.wealth += 1
+        self.model.log.append(self.unique_id)
+
+
+class LogPolicy:
+    '''
+    Group policy which steps each sub agent
+    '''
+
+    def step(self, agent):
+        agent.step()
+
+
+class LogModel(Model):
+
+    def __init__(self, n, seed = 0, **kwargs):
+        super().__init__(seed = seed)
+        self.log = []
+        self.ml = mlm.MultiLevel_Mesa(self, **kwargs)
+        self.population = [LogAgent(i, self) for i in range(n)]
+        for agent in self.population:
+            self.ml.add(agent)
+
+    def link(self, size, **attributes):
+        '''
+        Links every size agents as a clique with attributes
+        '''
+
+        for group in chunks(self.population, size):
+            for i, a in enumerate(group):
+                for b in group[i+1:]:
+                    self.ml.net.add_edge(a, b, **attributes)
+
+
+def chain(depth, extra):
+    '''
+    Returns a group_to_net model with group agents nested depth levels
+    deep, each holding the group below and extra agents (the bottom group
+    holds two agents), and the list of the group agents from the bottom up
+    '''
+
+    model = LogModel(2 + depth * extra, group_to_net = True)
+    ml = model.ml
+    agents = iter(model.population)
+    members = [next(agents), next(agents)]
+    groups = []
+    for _ in range(depth):
+        group = ml._new_group(members, (members[0], members[1]), 'default',
+                              False, LogPolicy, True, None)
+        groups.append(group)
+        members = [group] + [next(agents) for _ in range(extra)]
+    return model, groups
+
+
+def chunks(agents, size):
+    '''
+    User process for form_group, yields consecutive lists of size agents
+    '''
+
+    for i in range(0, len(agents) - size + 1, size):
+        yield agents[i:i+size]
+
+
+def groups_of(ml):
+    '''
+    Returns the groups of ml as a sorted list of (group id, sorted ids of
+    the sub_agents)
+    '''
+
+    return sorted((str(group_id), sorted(map(str, group.sub_agents)))
+                  for group_id, group in ml.groups.items())
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of MultiLevel_Mesa.form_groups_bulk
+"""
+
+import itertools
+
+import pytest
+
+from models import LogModel, LogPolicy, groups_of
+
+
+def sub_edges(group):
+    return sorted(tuple(sorted((a.unique_id, b.unique_id)))
+                  for a, b in group.sub_net.edges())
+
+
+def clique(group):
+    return sorted(itertools.combinations(sorted(group.sub_agents), 2))
+
+
+def bulk(model, pairs, link_type = 'trade'):
+    agents = model.population
+    edges = [(agents[a], agents[b]) for a, b in pairs]
+    return model.ml.form_groups_bulk(edges, link_type, link_type,
+                                     policy = LogPolicy)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_components_form_fully_connected_groups(compact):
+    model = LogModel(12, compact_groups = compact)
+    formed = bulk(model, [(0, 1), (1, 2), (2, 3), (5, 4), (7, 8), (4, 6)])
+    ml = model.ml
+    assert sorted(sorted(group.sub_agents) for group in formed) == \
+        [[0, 1, 2, 3], [4, 5, 6], [7, 8]]
+    for group in formed:
+        assert sub_edges(group) == clique(group)
+    #grouped agents leave the schedule, the links enter the network
+    assert sorted(map(str, ml.multi_sched)) == \
+        sorted([str(group.unique_id) for group in formed] + ['9', '10', '11'])
+    assert ml.net.has_edge(model.population[2], model.population[3])
+
+
+def test_bulk_sub_net_matches_group_iterate():
+    pairs = [(0, 1), (1, 2), (2, 3), (4, 5)]
+    iterated = LogModel(8)
+    agents = iterated.population
+    iterated.ml.group_iterate([(agents[a], agents[b]) for a, b in pairs],
+                              'trade', False, LogPolicy, False, 'trade')
+    model = LogModel(8)
+    bulk(model, pairs)
+    assert groups_of(model.ml) == groups_of(iterated.ml)
+    assert [sub_edges(group) for group in model.ml.groups.values()] == \
+        [sub_edges(group) for group in iterated.ml.groups.values()]
+
+
+def test_components_join_an_existing_group():
+    model = LogModel(10)
+    existing, = bulk(model, [(0, 1)])
+    #2 and 3 join the group of 1, 4 and 5 form their own
+    formed = bulk(model, [(2, 1), (3, 2), (4, 5)])
+    ml = model.ml
+    assert formed[0] is existing
+    assert sorted(existing.sub_agents) == [0, 1, 2, 3]
+    assert sub_edges(existing) == clique(existing)
+    assert len(ml.groups) == 2
+    for unique_id in range(6):
+        assert unique_id not in ml.multi_sched
+        assert len(ml.reverse_groups[unique_id]['trade']) == 1
+
+
+def test_link_type_keeps_groups_of_other_types():
+    model = LogModel(6)
+    family, = bulk(model, [(0, 1)], link_type = 'family')
+    trade, = bulk(model, [(1, 2)])
+    ml = model.ml
+    assert trade is not family
+    assert sorted(family.sub_agents) == [0, 1]
+    assert sorted(trade.sub_agents) == [1, 2]
+    assert ml.reverse_groups[1]['family'] == {family.unique_id}
+    assert ml.reverse_groups[1]['trade'] == {trade.unique_id}
+    assert ml.group_type_counts['family'] == 1
+    assert ml.group_type_counts['trade'] == 1
+
+
+def test_min_for_group_cutoff_applies_after_forming():
+    model = LogModel(8, min_for_group = 3)
+    pair, triple = bulk(model, [(0, 1), (2, 3), (3, 4)])
+    ml = model.ml
+    #as with group_iterate a pair forms a group below min_for_group
+    assert sorted(pair.sub_agents) == [0, 1]
+    assert sorted(triple.sub_agents) == [2, 3, 4]
+    #losing an agent drops the group below the cutoff and dissolves it
+    ml.remove(model.population[4])
+    assert triple.unique_id not in ml.groups
+    assert 2 in ml.multi_sched and 3 in ml.multi_sched
+    ml.remove(model.population[5])
+    assert pair.unique_id in ml.groups
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the checkpoint module
+"""
+
+import pytest
+
+import multilevel_mesa as mlm
+from multilevel_mesa.checkpoint import restore, snapshot
+
+from models import LogModel, LogPolicy, groups_of
+
+
+SETUPS = {"default": {},
+          "compact": {"compact_groups": True},
+          "compact_graph": {"graph_backend": mlm.CompactGraph},
+          "group_to_net": {"group_to_net": True}}
+
+
+def build(setup):
+    model = LogModel(60, seed = 3, **SETUPS[setup])
+    model.link(5, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    if model.ml.group_net:
+        groups = list(model.ml.groups.values())
+        for a, b in zip(groups[::2], groups[1::2]):
+            model.ml.net.add_edge(a, b, trade = 1)
+        model.ml.net_group(link_type = 'trade', link_value = 1,
+                           policy = LogPolicy)
+    #leave deleted keys in the schedules before the checkpoint
+    for unique_id in (1, 7, 22, 40, 41, 55):
+        model.ml.remove(model.population[unique_id])
+    model.ml.step()
+    return model
+
+
+def run(model, steps = 3):
+    del model.log[:]
+    for _ in range(steps):
+        model.ml.step()
+    return list(model.log)
+
+
+@pytest.mark.parametrize("setup", sorted(SETUPS))
+def test_restore_continues_the_run(setup):
+    model = build(setup)
+    state = snapshot(model.ml)
+    expected = run(model)
+
+    other = LogModel(0)
+    other.ml = restore(state, other)
+    assert run(other) == expected
+    assert groups_of(other.ml) == groups_of(model.ml)
+
+
+@pytest.mark.parametrize("setup", ["default", "group_to_net"])
+def test_checkpoint_files_continue_the_run(setup, tmp_path):
+    model = build(setup)
+    mlm.save_checkpoint(model.ml, str(tmp_path))
+    expected = run(model)
+
+    other = LogModel(0)
+    other.ml = mlm.load_checkpoint(str(tmp_path), other)
+    assert run(other) == expected
+    assert list(other.ml.multi_sched) == list(model.ml.multi_sched)
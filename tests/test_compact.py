@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the implicit clique of compact group agents
+"""
+
+import itertools
+import random
+
+import pytest
+
+from models import LogModel, LogPolicy
+
+
+def group_of(size, compact):
+    model = LogModel(size + 2, compact_groups = compact)
+    agents = model.population
+    group, = model.ml.form_groups_bulk([(agents[0], agent)
+                                        for agent in agents[1:size]],
+                                       policy = LogPolicy)
+    return model, group
+
+
+def links(group):
+    #every pair of sub_agents has_sub_edge reports as linked
+    members = sorted(group.sub_agents.values(),
+                     key = lambda agent: agent.unique_id)
+    return {(u.unique_id, v.unique_id)
+            for u, v in itertools.combinations(members, 2)
+            if group.has_sub_edge(u, v)}
+
+
+def sub_net_links(group):
+    return {tuple(sorted((u.unique_id, v.unique_id)))
+            for u, v in group.sub_net.edges()}
+
+
+def test_removed_implied_link_is_absent_until_added():
+    model, group = group_of(5, True)
+    a, b, c = model.population[:3]
+    assert group._live_net() is None
+    group.remove_sub_edge(a, b)
+    assert not group.has_sub_edge(a, b) and not group.has_sub_edge(b, a)
+    assert group.has_sub_edge(a, c) and group.has_sub_edge(b, c)
+    assert (a, b) not in set(group.edge_buffer(None, None))
+    #asking has_sub_edge does not build the sub_net
+    assert group._live_net() is None
+    group.add_sub_edge(b, a)
+    assert group.has_sub_edge(a, b)
+    assert group._absent == {}
+    assert sub_net_links(group) == links(group) == \
+        set(itertools.combinations(range(5), 2))
+
+
+def test_materialized_sub_net_keeps_the_absent_links():
+    model, group = group_of(5, True)
+    a, b, c, d = model.population[:4]
+    group.remove_sub_edge(a, b)
+    group.remove_sub_edge(c, d)
+    expected = set(itertools.combinations(range(5), 2)) - {(0, 1), (2, 3)}
+    assert sub_net_links(group) == links(group) == expected
+    #once built, the sub_net follows further changes
+    group.add_sub_edge(a, b)
+    group.remove_sub_edge(a, c)
+    expected = expected - {(0, 2)} | {(0, 1)}
+    assert sub_net_links(group) == links(group) == expected
+    #a joining agent drops the sub_net, it is built again with the absent
+    #links and the new agent linked to every sub_agent
+    new = model.population[5]
+    model.ml.form_groups_bulk([(a, new)], policy = LogPolicy)
+    assert group._live_net() is None
+    expected |= {(unique_id, 5) for unique_id in range(5)}
+    assert links(group) == sub_net_links(group) == expected
+
+
+def test_removed_agent_takes_its_absent_links():
+    model, group = group_of(5, True)
+    a, b, c = model.population[:3]
+    group.remove_sub_edge(a, b)
+    group.remove_sub_edge(b, c)
+    model.ml.remove(b)
+    assert group._absent == {}
+    assert links(group) == sub_net_links(group) == \
+        set(itertools.combinations([0, 2, 3, 4], 2))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compact_group_matches_explicit_sub_net(seed):
+    rng = random.Random(seed)
+    compact_model, compact = group_of(6, True)
+    model, explicit = group_of(6, False)
+    for i in range(40):
+        a, b = rng.sample(range(6), 2)
+        if rng.random() < 0.6:
+            compact.remove_sub_edge(compact_model.population[a],
+                                    compact_model.population[b])
+            explicit.remove_sub_edge(model.population[a], model.population[b])
+        else:
+            compact.add_sub_edge(compact_model.population[a],
+                                 compact_model.population[b])
+            explicit.add_sub_edge(model.population[a], model.population[b])
+        assert links(compact) == links(explicit)
+        if i == 20:
+            #build the compact sub_net half way through
+            assert sub_net_links(compact) == sub_net_links(explicit)
+    assert sub_net_links(compact) == sub_net_links(explicit) == \
+        links(explicit)
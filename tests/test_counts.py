@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that the counters of MultiLevel_Mesa (agent_count, group_count and
+level_count) match a walk of the managers
+"""
+
+from collections import Counter
+
+import pytest
+
+from models import LogAgent, LogModel, LogPolicy
+
+
+def walk_level(group):
+    #level of group worked out from its sub_agents
+    return 1 + max((walk_level(agent) for agent in group.sub_agents.values()
+                    if agent.type == 'group'), default = 0)
+
+
+def check_counts(ml):
+    agents = Counter(type(agent) for agent in ml._agents.values())
+    #the cached agent_count is the one a rebuild gives
+    assert ml.agent_count == tuple((k, len(v)) for k, v in
+                                   ml.agents_by_type.items())
+    assert {k: v for k, v in ml.agent_count if v} == dict(agents)
+    assert ml.active_agent_count == len(ml.multi_sched)
+    assert dict(ml.group_count) == \
+        dict(Counter(group.group_type for group in ml.groups.values()))
+    levels = Counter(walk_level(group) for group in ml.groups.values())
+    assert dict(ml.level_count) == dict(levels)
+    for group in ml.groups.values():
+        assert ml.level_of(group) == group.level == walk_level(group)
+        for agent in group.sub_agents.values():
+            assert agent.type != 'group' or agent.unique_id in ml.groups
+
+
+def peel(group_agent):
+    #user process for reassess_group, drops two agents of some trade groups
+    if group_agent.group_type != 'trade':
+        return None
+    subs = sorted(group_agent.sub_agents.values(),
+                  key = lambda agent: agent.unique_id)
+    if subs[0].unique_id % 9 == 0:
+        return subs[0], subs[1]
+    return None
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_counts_follow_every_change(compact):
+    model = LogModel(60, group_to_net = True, compact_groups = compact)
+    ml = model.ml
+    agents = model.population
+    check_counts(ml)
+
+    #form level 1 groups from the network
+    model.link(3, trade = 1)
+    ml.net_group('trade', 1, policy = LogPolicy)
+    check_counts(ml)
+    ml.step()
+    check_counts(ml)
+
+    #links cut between agents split or dissolve their groups
+    ml.net.remove_edge(agents[0], agents[1])
+    ml.net.remove_edge(agents[0], agents[2])
+    ml.net.remove_edge(agents[30], agents[31])
+    ml.reassess_net_group('trade', 1)
+    check_counts(ml)
+    ml.reassess_group(peel, group_type = 'trade')
+    check_counts(ml)
+
+    #nest pairs of the remaining groups
+    trade = sorted(ml.groups.values(), key = lambda group: str(group.unique_id))
+    ml.form_groups_bulk([(trade[i], trade[i + 1])
+                         for i in range(0, 8, 2)], 'nest', policy = LogPolicy)
+    ml.form_groups_bulk([(trade[8], agents[59])], 'nest', policy = LogPolicy)
+    check_counts(ml)
+    assert dict(ml.level_count) == {1: len(trade), 2: 5}
+    ml.step()
+    check_counts(ml)
+
+    #removing agents dissolves their groups and the groups nesting them
+    nests = [group for group in ml.groups.values()
+             if group.group_type == 'nest' and len(group.sub_agents) == 2
+             and all(agent.type == 'group'
+                     for agent in group.sub_agents.values())]
+    nest_count = dict(ml.group_count)['nest']
+    first, second = [next(iter(nest.sub_agents.values())) for nest in nests[:2]]
+    ml.remove_many(list(first.sub_agents.values())[1:])
+    ml.remove_many(list(second.sub_agents.values())[2:])
+    check_counts(ml)
+    assert dict(ml.group_count)['nest'] == nest_count - 1
+    ml.remove(next(iter(second.sub_agents.values())))
+    check_counts(ml)
+    assert dict(ml.group_count)['nest'] == nest_count - 2
+    ml.remove_many([agents[i] for i in (12, 13, 24, 26, 40, 41, 42)
+                    if agents[i].unique_id in ml._agents])
+    check_counts(ml)
+    ml.step()
+    check_counts(ml)
+
+    #new agents enter the counts
+    ml.add_many([LogAgent(i, model) for i in range(60, 70)])
+    check_counts(ml)
+    ml.remove_many([agent for agent in ml.multi_sched.values()
+                    if agent.type != 'group'][:5])
+    check_counts(ml)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of MultiLevel_Mesa.form_group
+"""
+
+import random
+
+import pytest
+
+from models import LogModel, LogPolicy, chunks, groups_of
+
+
+BATCH_SIZES = [None, 1, 2, 3, 10]
+
+
+def linked_through(agents):
+    #[b, c] only links the groups of [a, b] and [c, d] through their agents
+    a, b, c, d, e, f = agents[:6]
+    yield [a, b]
+    yield [c, d]
+    yield [b, c]
+    yield [e, f]
+
+
+def overlapping(agents, seed):
+    #random results which overlap each other, repeat and yield their own id
+    rng = random.Random(seed)
+    for i in range(60):
+        result = rng.sample(agents, rng.randint(1, 5))
+        if i % 7 == 0:
+            yield ("own%d" % i, result)
+        else:
+            yield result
+        if i % 11 == 0:
+            yield result
+
+
+def form(process, *args, batch_size = None, dead = ()):
+    model = LogModel(40)
+    for unique_id in dead:
+        model.ml.remove(model.population[unique_id])
+    model.ml.form_group(process, model.population, *args,
+                        policy = LogPolicy, batch_size = batch_size)
+    return model.ml
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_batch_size_does_not_change_linked_results(batch_size):
+    ml = form(linked_through, batch_size = batch_size)
+    assert groups_of(ml) == groups_of(form(linked_through))
+    assert len(ml.groups) == 3
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_size_does_not_change_overlapping_results(seed):
+    expected = groups_of(form(overlapping, seed, dead = [3, 17]))
+    for batch_size in BATCH_SIZES[1:]:
+        ml = form(overlapping, seed, batch_size = batch_size, dead = [3, 17])
+        assert groups_of(ml) == expected
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_grouped_agents_leave_the_schedule(batch_size):
+    ml = form(chunks, 4, batch_size = batch_size)
+    assert len(ml.groups) == 10
+    assert len(ml.multi_sched) == 10
+    for group in ml.groups.values():
+        for sub_id in group.sub_agents:
+            assert sub_id not in ml.multi_sched
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the graph backends of the master network
+"""
+
+import pytest
+
+import multilevel_mesa as mlm
+
+from models import LogAgent, LogModel
+
+
+def test_compact_graph_rejects_a_second_node_with_the_same_id():
+    model = LogModel(3, graph_backend = mlm.CompactGraph)
+    net = model.ml.net
+    twin = LogAgent(1, model)
+    with pytest.raises(ValueError):
+        net.add_node(twin)
+    with pytest.raises(ValueError):
+        net.add_edge(model.population[0], twin)
+    assert net.has_node(model.population[1])
+    assert not net.has_edge(model.population[0], model.population[1])
+
+
+def test_compact_graph_adds_the_same_node_again():
+    model = LogModel(3, graph_backend = mlm.CompactGraph)
+    net = model.ml.net
+    a, b = model.population[:2]
+    net.add_node(a)
+    net.add_edge(a, b, trade = 1)
+    net.add_edge(a, b, trade = 2)
+    assert net.has_edge(a, b)
+    assert len(net.edge_list()) == 1
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the levels of group agents in the hierarchy
+"""
+
+from multilevel_mesa.multilevel_mesa import GroupAgent
+
+from models import LogModel, LogPolicy, chain
+
+
+def check_levels(ml):
+    #every group agent is one above its deepest nested group agent and is
+    #indexed under its level
+    for group_id, group in ml.groups.items():
+        nested = [agent.level for agent in group.sub_agents.values()
+                  if isinstance(agent, GroupAgent)]
+        assert group.level == 1 + max(nested, default = 0)
+        assert ml.levels[group.level][group_id] is group
+    indexed = sum(len(groups) for groups in ml.levels.values())
+    assert indexed == len(ml.groups)
+
+
+def build():
+    #four groups of three agents, the first two grouped again as super
+    model = LogModel(12, group_to_net = True)
+    model.link(3, trade = 1)
+    ml = model.ml
+    ml.net_group(link_type = 'trade', link_value = 1, policy = LogPolicy)
+    groups = list(ml.groups.values())
+    ml.net.add_edge(groups[0], groups[1], kin = 1)
+    ml.net_group(link_type = 'kin', link_value = 1, policy = LogPolicy)
+    (super_id,) = [g for g in ml.groups if g not in
+                   [group.unique_id for group in groups]]
+    return model, groups, ml.groups[super_id]
+
+
+def test_nested_join_raises_ancestors():
+    model, groups, super_group = build()
+    assert (groups[0].level, super_group.level) == (1, 2)
+    #the third group joins the first through a link to one of its agents
+    model.ml.group_iterate([(model.population[0], groups[2])], 'default',
+                           False, LogPolicy, True, 'trade')
+    assert groups[2].unique_id in groups[0].sub_agents
+    assert (groups[0].level, super_group.level) == (2, 3)
+    check_levels(model.ml)
+
+
+def test_nested_leave_lowers_ancestors():
+    model, groups, super_group = build()
+    model.ml.group_iterate([(model.population[0], groups[2])], 'default',
+                           False, LogPolicy, True, 'trade')
+    groups[0].remove([groups[2].unique_id], model.ml.min)
+    assert (groups[0].level, super_group.level) == (1, 2)
+    check_levels(model.ml)
+
+
+def test_bottom_up_steps_children_first():
+    model, groups, super_group = build()
+    model.ml.group_iterate([(model.population[0], groups[2])], 'default',
+                           False, LogPolicy, True, 'trade')
+    order = []
+    for group in model.ml.groups.values():
+        group.level_step = (lambda group: lambda *args:
+                            order.append(group.unique_id))(group)
+    model.ml.step(order = "bottom_up")
+    position = {group_id: i for i, group_id in enumerate(order)}
+    for group in model.ml.groups.values():
+        for sub_id, agent in group.sub_agents.items():
+            if isinstance(agent, GroupAgent):
+                assert position[sub_id] < position[group.unique_id]
+
+
+def count_relevels(monkeypatch):
+    calls = []
+    relevel = GroupAgent._relevel
+
+    def counted(group):
+        calls.append(group.unique_id)
+        relevel(group)
+
+    monkeypatch.setattr(GroupAgent, "_relevel", counted)
+    return calls
+
+
+def test_dissolving_chain_is_not_relevelled(monkeypatch):
+    model, groups = chain(300, 1)
+    calls = count_relevels(monkeypatch)
+    model.ml.remove(model.population[0])
+    assert len(model.ml.groups) == 0
+    assert calls == []
+
+
+def test_surviving_chain_is_relevelled_once(monkeypatch):
+    model, groups = chain(300, 2)
+    assert groups[-1].level == 300
+    calls = count_relevels(monkeypatch)
+    model.ml.remove(model.population[0])
+    assert len(model.ml.groups) == 299
+    assert calls == [groups[1].unique_id]
+    assert groups[-1].level == 299
+    check_levels(model.ml)
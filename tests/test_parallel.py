@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of stepping group agents in parallel threads
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+import pytest
+
+from models import LogAgent, LogModel, LogPolicy, groups_of
+
+
+class LeavingAgent(LogAgent):
+    '''
+    Agent which removes itself from the model on its third step if its id is
+    a multiple of seven
+    '''
+
+    def step(self):
+        super().step()
+        if self.wealth == 4 and self.unique_id % 7 == 0:
+            self.model.ml.remove(self)
+
+
+def build(agent_class = LogAgent, group_to_net = False):
+    model = LogModel(0, shuffle_seed = 11, group_to_net = group_to_net)
+    for unique_id in range(64):
+        agent = agent_class(unique_id, model)
+        model.population.append(agent)
+        model.ml.add(agent)
+    model.link(4, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    if group_to_net:
+        groups = list(model.ml.groups.values())
+        for a, b in zip(groups[::2], groups[1::2]):
+            model.ml.net.add_edge(a, b, kin = 1)
+        model.ml.net_group(link_type = 'kin', link_value = 1,
+                           policy = LogPolicy)
+    #agents outside of any group
+    for agent in model.population[60:]:
+        model.ml.remove(agent)
+        model.ml.add(agent)
+    return model
+
+
+def state(model):
+    return (sorted(model.log), [agent.wealth for agent in model.population],
+            groups_of(model.ml), sorted(map(str, model.ml.multi_sched)),
+            sorted(map(str, model.ml._agents)))
+
+
+@pytest.mark.parametrize("group_to_net", [False, True])
+@pytest.mark.parametrize("agent_class", [LogAgent, LeavingAgent])
+@pytest.mark.parametrize("workers", [1, 2, 5])
+def test_parallel_step_matches_serial(group_to_net, agent_class, workers):
+    serial = build(agent_class, group_to_net)
+    parallel = build(agent_class, group_to_net)
+    for _ in range(4):
+        serial.ml.step()
+        parallel.ml.step(workers = workers)
+        assert state(parallel) == state(serial)
+
+
+def test_parallel_step_reuses_executor():
+    serial = build(LeavingAgent)
+    parallel = build(LeavingAgent)
+    with ThreadPoolExecutor(3) as executor:
+        for _ in range(4):
+            serial.ml.step()
+            parallel.ml.step(workers = 4, executor = executor)
+            assert state(parallel) == state(serial)
+
+
+def member_orders(model):
+    #order each group agent stepped its sub_agents in, from the log
+    position = {}
+    for i, unique_id in enumerate(model.log):
+        position.setdefault(unique_id, i)
+    return {str(group_id): sorted(group.sub_agents,
+                                  key = lambda uid: position.get(uid, -1))
+            for group_id, group in model.ml.groups.items()}
+
+
+def build_unseeded():
+    model = LogModel(64, seed = 5)
+    model.link(8, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    return model
+
+
+def test_parallel_step_without_shuffle_seed_ignores_thread_timing():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        runs = []
+        for workers in (1, 8, 8, 8):
+            model = build_unseeded()
+            orders = []
+            for _ in range(3):
+                del model.log[:]
+                model.ml.step(workers = workers)
+                orders.append(member_orders(model))
+            runs.append(orders)
+    finally:
+        sys.setswitchinterval(interval)
+    assert all(orders == runs[0] for orders in runs)
+    assert model.ml.streams != None
+    assert all(group.streams is model.ml.streams
+               for group in model.ml.groups.values())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of MultiLevel_Mesa.reassess_net_group and reassess_group
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import random
+
+import pytest
+
+import multilevel_mesa as mlm
+
+from models import LogModel, LogPolicy, groups_of
+
+
+def build(**kwargs):
+    model = LogModel(80, **kwargs)
+    model.link(8, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    return model
+
+
+def cut(model, rng, count):
+    #removes count random links of the master network
+    edges = sorted((u.unique_id, v.unique_id) for u, v in model.ml.net.edges())
+    for u, v in rng.sample(edges, min(count, len(edges))):
+        model.ml.net.remove_edge(model.population[u], model.population[v])
+
+
+@pytest.mark.parametrize("backend", [mlm.NetworkXGraph, mlm.CompactGraph])
+@pytest.mark.parametrize("values", [[1], [1, None]])
+def test_incremental_matches_full(backend, values):
+    incremental = build(graph_backend = backend)
+    full = build(graph_backend = backend)
+    rng, full_rng = random.Random(5), random.Random(5)
+    for i in range(12):
+        cut(incremental, rng, 15)
+        cut(full, full_rng, 15)
+        link_value = values[i % len(values)]
+        incremental.ml.reassess_net_group('trade', link_value)
+        full.ml.reassess_net_group('trade', link_value, full = True)
+        assert groups_of(incremental.ml) == groups_of(full.ml)
+
+
+def test_lagging_reader_is_dropped():
+    incremental = build()
+    full = build()
+    incremental.ml.net.journal.max_lag = 10
+    rng, full_rng = random.Random(2), random.Random(2)
+    incremental.ml.reassess_net_group('trade', 1)
+    cut(incremental, rng, 40)
+    cut(full, full_rng, 40)
+    journal = incremental.ml.net.journal
+    assert 'trade' not in journal.cursors
+    assert len(journal.entries) == 0
+    incremental.ml.reassess_net_group('trade', 1)
+    full.ml.reassess_net_group('trade', 1, full = True)
+    assert groups_of(incremental.ml) == groups_of(full.ml)
+
+
+def test_cursors_are_kept_per_link_type():
+    model = build()
+    for link_value in (1, 2, 3, None):
+        model.ml.reassess_net_group('trade', link_value)
+    assert list(model.ml.net.journal.cursors) == ['trade']
+    assert list(model.ml.group_journal.cursors) == ['trade']
+    model.ml.stop_net_journal('trade')
+    assert model.ml.net.journal.cursors == {}
+    assert model.ml.group_journal.cursors == {}
+    cut(model, random.Random(0), 10)
+    assert model.ml.net.journal.entries == []
+
+
+def peel(group_agent):
+    #user process for reassess_group, decided by the ids of the group only
+    subs = sorted(group_agent.sub_agents.values(),
+                  key = lambda agent: agent.unique_id)
+    first = subs[0].unique_id
+    if first % 12 == 0:
+        return subs[0], subs[1]
+    if first % 12 == 4:
+        return subs[:3]
+    return None
+
+
+def reassessed(**kwargs):
+    model = LogModel(96)
+    model.link(4, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    before = set(model.ml.groups)
+    model.ml.reassess_group(peel, group_type = 'trade', **kwargs)
+    ml = model.ml
+    #peeled agents are no longer recorded in their old group
+    for group_id, group in ml.groups.items():
+        for agent in model.population:
+            assert (group_id in ml.reverse_groups[agent.unique_id]['trade']) \
+                == (agent.unique_id in group.sub_agents)
+    return (groups_of(ml), sorted(map(str, before - set(ml.groups))),
+            sorted(map(str, ml.multi_sched)),
+            sorted((u.unique_id, v.unique_id) for u, v in ml.net.edges()))
+
+
+def test_threaded_reassess_group_matches_serial():
+    serial = reassessed()
+    #some groups are peeled, some dissolve and some are left alone
+    assert serial[1] and len(serial[0]) > len(serial[1])
+    assert reassessed(workers = 3) == serial
+    with ThreadPoolExecutor(2) as executor:
+        assert reassessed(workers = 3, executor = executor) == serial
+        assert reassessed(executor = executor) == serial
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of removing agents from MultiLevel_Mesa and from group agents
+"""
+
+import pytest
+
+from models import LogModel, LogPolicy, chain, groups_of
+
+
+def build(n = 40, size = 5, **kwargs):
+    model = LogModel(n, **kwargs)
+    model.link(size, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1,
+                       policy = LogPolicy)
+    return model
+
+
+@pytest.mark.parametrize("container", [list, tuple, set, frozenset])
+def test_group_remove_takes_any_collection_of_ids(container):
+    model = build()
+    group = next(iter(model.ml.groups.values()))
+    first, second = list(group.sub_agents)[:2]
+    status, _ = group.remove(container([first, second]), model.ml.min)
+    assert status is None
+    assert first not in group.sub_agents
+    assert second not in group.sub_agents
+    assert len(group.sub_agents) == 3
+
+
+def test_group_remove_takes_one_id():
+    model = build()
+    group = next(iter(model.ml.groups.values()))
+    first = next(iter(group.sub_agents))
+    group.remove(first, model.ml.min)
+    assert first not in group.sub_agents
+    assert len(group.sub_agents) == 4
+
+
+def state(ml):
+    #managers of ml by unique_id, independent of the agent objects
+    reverse = {str(uid): {t: sorted(map(str, ids)) for t, ids in types.items()
+                          if ids}
+               for uid, types in ml.reverse_groups.items()}
+    reverse = {uid: types for uid, types in reverse.items() if types}
+    return (groups_of(ml), sorted(map(str, ml.multi_sched)),
+            sorted(map(str, ml._agents)), reverse,
+            sorted((str(u.unique_id), str(v.unique_id))
+                   for u, v in ml.net.edges()))
+
+
+def build_hierarchy(group_to_net):
+    model = build(60, 3, group_to_net = group_to_net)
+    if group_to_net:
+        groups = list(model.ml.groups.values())
+        for a, b in zip(groups[::2], groups[1::2]):
+            model.ml.net.add_edge(a, b, kin = 1)
+        model.ml.net_group(link_type = 'kin', link_value = 1,
+                           policy = LogPolicy)
+    return model
+
+
+@pytest.mark.parametrize("group_to_net", [False, True])
+@pytest.mark.parametrize("ids", [[0, 1, 2], [0, 1, 5, 9, 10, 30, 31, 59],
+                                 list(range(0, 60, 2)), [4, 4, 4, 7]])
+def test_remove_many_matches_remove(group_to_net, ids):
+    batched = build_hierarchy(group_to_net)
+    single = build_hierarchy(group_to_net)
+    removed = batched.ml.remove_many([batched.population[i] for i in ids])
+    for i in dict.fromkeys(ids):
+        single.ml.remove(single.population[i])
+    assert state(batched.ml) == state(single.ml)
+    assert sorted(map(str, removed.agents)) == \
+           sorted(set(map(str, ids)))
+
+
+@pytest.mark.parametrize("depth", [1000, 1500])
+def test_deep_chain_dissolves_without_recursion(depth):
+    model, groups = chain(depth, 1)
+    assert groups[-1].level == depth
+    removed = model.ml.remove(model.population[0])
+    assert len(removed.groups) == depth
+    assert len(model.ml.groups) == 0
+    assert not any(model.ml.levels.values())
+    #the agents of every level are back in the schedule
+    assert sorted(model.ml.multi_sched) == list(range(1, len(model.population)))
+
+
+def test_group_remove_returns_the_removed_agents():
+    model = build()
+    group = next(iter(model.ml.groups.values()))
+    first, second = list(group.sub_agents.values())[:2]
+    status, _, removed = group.remove([second.unique_id, "absent",
+                                       first.unique_id, second.unique_id],
+                                      model.ml.min, return_removed = True)
+    assert status is None
+    assert removed == [second, first]
+    status, _, removed = group.remove([], model.ml.min,
+                                      return_removed = True)
+    assert removed == []
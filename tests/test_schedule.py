@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the schedule dictionaries
+"""
+
+import pickle
+import random
+
+import pytest
+
+from multilevel_mesa.schedule import (ScheduleDict, ShuffleStreams,
+                                      TaggedScheduleDict)
+
+from models import LogModel, LogPolicy
+
+
+@pytest.mark.parametrize("cls", [ScheduleDict, TaggedScheduleDict])
+def test_pickled_schedule_shuffles_the_same(cls):
+    schedule = cls((i, str(i)) for i in range(100))
+    list(schedule.buffer(True, random.Random(0)))
+    #too few deleted keys to be compacted
+    for i in range(0, 100, 10):
+        del schedule[i]
+    copy = pickle.loads(pickle.dumps(schedule))
+    assert list(copy) == list(schedule)
+    rng, copy_rng = random.Random(1), random.Random(1)
+    for _ in range(3):
+        assert list(schedule.buffer(True, rng)) == \
+               list(copy.buffer(True, copy_rng))
+
+
+def shuffled(streams, unique_id, n = 50):
+    return list(ScheduleDict((i, i) for i in range(n)).buffer(
+        True, streams.rng(unique_id)))
+
+
+def test_shuffle_streams_repeat_for_the_same_seed():
+    first, second = ShuffleStreams(7), ShuffleStreams(7)
+    for step in range(3):
+        first.step = second.step = step
+        assert shuffled(first, "group1") == shuffled(second, "group1")
+    assert shuffled(ShuffleStreams(8), "group1") != shuffled(first, "group1")
+
+
+def test_shuffle_streams_are_independent_per_group():
+    streams = ShuffleStreams(7)
+    alone = shuffled(streams, "group1")
+    #asking for other streams first does not change the stream of group1
+    for unique_id in ("group2", "group3", None):
+        shuffled(streams, unique_id)
+    assert shuffled(streams, "group1") == alone
+    assert shuffled(streams, "group2") != alone
+    streams.step = 1
+    assert shuffled(streams, "group1") != alone
+
+
+def test_model_shuffle_seed_repeats_group_orders():
+    #model.random is seeded differently, the orders only follow the streams
+    orders = []
+    for seed in range(2):
+        model = LogModel(40, seed = seed, shuffle_seed = 3)
+        model.link(5, trade = 1)
+        model.ml.net_group(link_type = 'trade', link_value = 1,
+                           policy = LogPolicy)
+        model.ml.step()
+        orders.append(list(model.log))
+    assert orders[0] == orders[1]
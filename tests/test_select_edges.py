@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of select_edges of the graph backends and the link selection of
+MultiLevel_Mesa.net_group against a plain Python filter
+"""
+
+import random
+
+import pytest
+
+import multilevel_mesa as mlm
+from multilevel_mesa.graph import OPERATORS
+
+from models import LogModel, LogPolicy
+
+
+BACKENDS = [mlm.NetworkXGraph, mlm.CompactGraph]
+
+#one comparison value (a collection for 'in') per attribute and operator,
+#'missing' is on no edge at all
+VALUES = {
+    "trade": [3, [1, 4, 9]],
+    "weight": [0.5, [0.25, 0.75]],
+    "kind": ["family", ["family", "work"]],
+    "flag": [True, [True]],
+    "missing": [1, [1]],
+}
+
+PREDICATES = [(attr, op, values[1] if op == "in" else values[0])
+              for attr, values in VALUES.items() for op in OPERATORS]
+
+
+def random_links(seed):
+    '''
+    (a, b, attributes) of random links, every attribute is left off some of
+    the links
+    '''
+
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < 80:
+        a, b = sorted(rng.sample(range(40), 2))
+        pairs.add((a, b))
+    links = []
+    for a, b in sorted(pairs):
+        attributes = {
+            "trade": rng.randint(0, 9),
+            "weight": rng.choice([0.25, 0.5, 0.75]),
+            "kind": rng.choice(["family", "work", "trade"]),
+            "flag": rng.random() < 0.5,
+        }
+        for attr in list(attributes):
+            if rng.random() < 0.2:
+                del attributes[attr]
+        links.append((a, b, attributes))
+    return links
+
+
+def build(backend, seed = 0):
+    model = LogModel(40, graph_backend = backend)
+    links = random_links(seed)
+    for a, b, attributes in links:
+        model.ml.net.add_edge(model.population[a], model.population[b],
+                              **attributes)
+    return model, links
+
+
+def matches(attributes, predicates):
+    #plain Python filter, links without the attribute never match
+    for attr, op, value in predicates:
+        if attributes.get(attr) is None:
+            return False
+        if op == "in":
+            if attributes[attr] not in value:
+                return False
+        elif not OPERATORS[op](attributes[attr], value):
+            return False
+    return True
+
+
+def expected(links, predicates):
+    return {frozenset((a, b)) for a, b, attributes in links
+            if matches(attributes, predicates)}
+
+
+def selected(net, predicates):
+    pairs = [frozenset((u.unique_id, v.unique_id))
+             for u, v in net.select_edges(predicates)]
+    assert len(pairs) == len(set(pairs))
+    return set(pairs)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("predicate", PREDICATES, ids = str)
+def test_select_edges_matches_python_filter(backend, predicate):
+    model, links = build(backend)
+    assert selected(model.ml.net, [predicate]) == expected(links, [predicate])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", range(3))
+def test_select_edges_combines_predicates(backend, seed):
+    model, links = build(backend, seed)
+    rng = random.Random(seed)
+    for _ in range(20):
+        predicates = rng.sample(PREDICATES, rng.randint(0, 3))
+        assert selected(model.ml.net, predicates) == \
+            expected(links, predicates)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_select_edges_rejects_unknown_operator(backend):
+    model, links = build(backend)
+    with pytest.raises(ValueError):
+        model.ml.net.select_edges([("trade", "=>", 3)])
+
+
+def components(pairs):
+    #connected components of pairs as a sorted list of sorted ids
+    groups = []
+    for pair in pairs:
+        touching = [group for group in groups if group & pair]
+        merged = set(pair).union(*touching)
+        groups = [group for group in groups if not group & pair] + [merged]
+    return sorted(sorted(group) for group in groups)
+
+
+NET_GROUPS = [
+    dict(link_type = "trade", link_value = 5),
+    dict(link_type = "trade", link_value = 5, link_op = "<"),
+    dict(link_type = "kind", link_value = "work"),
+    dict(link_type = "kind", link_value = "work", link_op = "!="),
+    dict(link_type = "trade", link_value = [1, 4, 9], link_op = "in",
+         predicates = [("weight", ">", 0.25)]),
+    dict(predicates = [("flag", "==", True), ("kind", "in", ["family"])]),
+]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("kwargs", NET_GROUPS, ids = str)
+def test_net_group_selects_links_as_python_filter(backend, kwargs):
+    kwargs = dict(kwargs)
+    predicates = list(kwargs.get("predicates", []))
+    if "link_value" in kwargs:
+        op = kwargs.get("link_op")
+        if op == None:
+            op = "==" if type(kwargs["link_value"]) == str else ">="
+        predicates.append((kwargs["link_type"], op, kwargs["link_value"]))
+    model, links = build(backend)
+    pairs = expected(links, predicates)
+    model.ml.net_group(policy = LogPolicy, bulk = True, **kwargs)
+    assert sorted(sorted(group.sub_agents)
+                  for group in model.ml.groups.values()) == components(pairs)
+    #link by link every agent of a selected link is grouped
+    model, links = build(backend)
+    model.ml.net_group(policy = LogPolicy, **kwargs)
+    grouped = set()
+    for group in model.ml.groups.values():
+        grouped.update(group.sub_agents)
+    assert grouped == set().union(*pairs)
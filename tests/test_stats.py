@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the profiling of MultiLevel_Mesa.step
+"""
+
+import pytest
+
+from models import LogAgent, LogModel, LogPolicy
+
+
+class BatchPolicy:
+    '''
+    Batch policy which adds one to the wealth of every member
+    '''
+
+    def step_group(self, group, batch):
+        batch["wealth"] = batch["wealth"] + 1
+
+
+def build(policy = LogPolicy, group_to_net = False):
+    model = LogModel(36, group_to_net = group_to_net)
+    model.link(4, trade = 1)
+    model.ml.net_group(link_type = 'trade', link_value = 1, policy = policy)
+    if group_to_net:
+        groups = list(model.ml.groups.values())
+        for a, b in zip(groups[::2], groups[1::2]):
+            model.ml.net.add_edge(a, b, trade = 1)
+        model.ml.net_group(link_type = 'trade', link_value = 1,
+                           policy = policy)
+    #agents outside of any group
+    for unique_id in range(36, 40):
+        agent = LogAgent(unique_id, model)
+        model.population.append(agent)
+        model.ml.add(agent)
+    return model
+
+
+@pytest.mark.parametrize("group_to_net", [False, True])
+@pytest.mark.parametrize("options", [{}, {"order": "bottom_up"},
+                                     {"workers": 2}])
+def test_sub_agents_are_counted_by_type(group_to_net, options):
+    model = build(group_to_net = group_to_net)
+    stats = model.ml.enable_stats()
+    model.ml.step(**options)
+    record = stats.totals
+    assert record.agents_stepped == len(model.log) == 40
+    assert record.groups_stepped == len(model.ml.groups)
+    #parallel steps time the group agents as a whole under groups
+    assert set(record.by_type) <= {"LogAgent", "GroupAgent"}
+    assert record.by_type["LogAgent"] > 0
+
+
+def test_batch_members_are_counted():
+    model = build(policy = BatchPolicy)
+    stats = model.ml.enable_stats()
+    model.ml.step()
+    assert stats.totals.agents_stepped == 40
+    assert [agent.wealth for agent in model.population] == [2] * 40
+    assert set(stats.totals.by_type) == {"LogAgent", "GroupAgent"}
+
+
+def test_disable_stats_stops_timing_sub_agents():
+    model = build()
+    stats = model.ml.enable_stats()
+    model.ml.step()
+    model.ml.disable_stats()
+    model.ml.step()
+    assert stats.totals.agents_stepped == 40
+    assert all(group.stats is None for group in model.ml.groups.values())
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of GroupAgent.subs_by_type, the TypeViews of the sub_agents
+"""
+
+from collections import defaultdict
+import random
+
+import pytest
+
+from models import LogAgent, LogModel, LogPolicy
+
+
+class OtherAgent(LogAgent):
+
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+        self.type = 'other'
+
+
+def dict_of_dicts(group):
+    #what subs_by_type returned when it was built as a dictionary
+    types = defaultdict(dict)
+    for agent in group.sub_agents.values():
+        types[type(agent)][agent.unique_id] = agent
+    return types
+
+
+def as_dicts(views):
+    return {cls: {key: view[key] for key in view}
+            for cls, view in views.items()}
+
+
+def check(group, views, cached):
+    expected = dict_of_dicts(group)
+    assert as_dicts(views) == expected
+    assert list(views) == list(expected)
+    for cls in (LogAgent, OtherAgent):
+        #views taken before the changes follow them
+        view = cached[cls]
+        assert list(view.items()) == list(expected[cls].items())
+        assert len(view) == len(expected[cls])
+        assert (cls in views) == (len(expected[cls]) > 0)
+        assert list(view.buffer()) == list(expected[cls].values())
+
+
+def grouped(n, seed):
+    rng = random.Random(seed)
+    model = LogModel(0, group_to_net = True)
+    agents = []
+    for i in range(n):
+        agent = (OtherAgent if rng.random() < 0.3 else LogAgent)(i, model)
+        model.ml.add(agent)
+        agents.append(agent)
+    group, = model.ml.form_groups_bulk([(agents[0], agent)
+                                        for agent in agents[1:]],
+                                       policy = LogPolicy)
+    return model, group, agents
+
+
+@pytest.mark.parametrize("n", [10, 150])
+def test_views_follow_adds_and_removes(n):
+    model, group, agents = grouped(n, n)
+    ml = model.ml
+    views = group.subs_by_type
+    cached = {cls: views[cls] for cls in (LogAgent, OtherAgent)}
+    check(group, views, cached)
+    rng = random.Random(n)
+    next_id = n
+    for _ in range(60):
+        if rng.random() < 0.6 and len(group.sub_agents) > 4:
+            ml.remove(rng.choice(list(group.sub_agents.values())))
+        else:
+            agent = (OtherAgent if rng.random() < 0.5 else LogAgent)(next_id,
+                                                                     model)
+            next_id += 1
+            ml.add(agent)
+            member = next(iter(group.sub_agents.values()))
+            ml.form_groups_bulk([(member, agent)], policy = LogPolicy)
+        assert group.unique_id in ml.groups
+        check(group, views, cached)
+
+
+def test_views_of_missing_types_are_empty():
+    model, group, agents = grouped(6, 1)
+    views = group.subs_by_type
+    view = views[OtherAgent]
+    for agent in agents:
+        if type(agent) is OtherAgent:
+            model.ml.remove(agent)
+    assert OtherAgent not in views
+    assert len(view) == 0 and dict(view) == {}
+    assert dict(views[str]) == {}
+    log_agent = next(iter(views[LogAgent].values()))
+    assert log_agent.unique_id not in view
+    with pytest.raises(KeyError):
+        view[log_agent.unique_id]
+
+
+def test_views_are_read_only():
+    model, group, agents = grouped(4, 2)
+    view = group.subs_by_type[LogAgent]
+    with pytest.raises(TypeError):
+        view[99] = agents[0]
+    with pytest.raises(TypeError):
+        group.subs_by_type[LogAgent] = {}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of GroupRecorder and read_chunks
+"""
+
+import glob
+import os
+
+import multilevel_mesa as mlm
+from multilevel_mesa.telemetry import DISSOLVED, FORMED, JOINED, LEFT
+
+from models import LogModel, LogPolicy
+
+
+def aggregate(ml):
+    #the aggregate row of ml from a walk of the managers
+    sizes = [len(group.sub_agents) for group in ml.groups.values()]
+    return (ml.steps, len(ml._agents), len(ml.multi_sched), len(sizes),
+            sum(sizes) / len(sizes) if sizes else 0.0,
+            max((group.level for group in ml.groups.values()), default = 0))
+
+
+def bulk(model, *pairs):
+    agents = model.population
+    return model.ml.form_groups_bulk([(agents[a], agents[b])
+                                      for a, b in pairs], policy = LogPolicy)
+
+
+def test_recording_round_trips_through_chunks(tmp_path):
+    path = str(tmp_path)
+    model = LogModel(20, group_to_net = True)
+    ml = model.ml
+    ml.start_recording(path, chunk_size = 3)
+    walked = []
+
+    #step 0: two groups form
+    first, second = bulk(model, (0, 1), (1, 2), (3, 4))
+    ml.step()
+    walked.append(aggregate(ml))
+    #step 1: an agent joins the first group
+    bulk(model, (5, 0))
+    ml.step()
+    walked.append(aggregate(ml))
+    #step 2: the first group loses an agent, the second dissolves
+    ml.remove(model.population[0])
+    ml.remove(model.population[3])
+    ml.step()
+    walked.append(aggregate(ml))
+    #step 3: a group nesting the first forms, step 4: nothing happens
+    ml.form_groups_bulk([(first, model.population[6])], 'nest',
+                        policy = LogPolicy)
+    ml.step()
+    walked.append(aggregate(ml))
+    ml.step()
+    walked.append(aggregate(ml))
+    ml.stop_recording()
+
+    events = mlm.read_chunks(path)
+    rows = list(zip(events["step"].tolist(), events["kind"].tolist(),
+                    events["group"].tolist(), events["uid"].tolist(),
+                    events["size"].tolist(), events["depth"].tolist(),
+                    events["lifetime"].tolist()))
+    assert rows[:2] == [(0, FORMED, 0, str(first.unique_id), 3, 1, 0),
+                        (0, FORMED, 1, str(second.unique_id), 2, 1, 0)]
+    assert rows[2] == (1, JOINED, 0, "", 4, 1, 1)
+    assert rows[3] == (2, LEFT, 0, "", 3, 1, 2)
+    assert rows[4:6] == [(2, LEFT, 1, "", 1, 1, 2),
+                         (2, DISSOLVED, 1, "", 1, 1, 2)]
+    assert rows[6][:3] == (3, FORMED, 2)
+    assert rows[6][4:] == (2, 2, 0)
+    assert len(rows) == 7
+    #seven events and five aggregate rows in chunks of three
+    assert len(glob.glob(os.path.join(path, "events-*.npz"))) == 3
+    assert len(glob.glob(os.path.join(path, "aggregates-*.npz"))) == 2
+
+    aggregates = mlm.read_chunks(path, "aggregates")
+    recorded = list(zip(aggregates["step"].tolist(),
+                        aggregates["agent_count"].tolist(),
+                        aggregates["active_agent_count"].tolist(),
+                        aggregates["groups"].tolist(),
+                        aggregates["mean_group_size"].tolist(),
+                        aggregates["max_depth"].tolist()))
+    assert recorded == walked
+    assert [row[3] for row in recorded] == [2, 2, 1, 2, 2]
+    assert [row[5] for row in recorded] == [1, 1, 1, 2, 2]
+
+
+def test_read_chunks_of_an_empty_recording(tmp_path):
+    assert mlm.read_chunks(str(tmp_path)) == {}